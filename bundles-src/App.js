@@ -13,6 +13,8 @@ import NoResults from "./components/NoResults";
 
 import './css/App.css';
 
+const SEARCH_DELAY = 250;  // ms to wait for the customer to stop typing before asking the server
+
 class App extends Component {
 
   constructor(props){
@@ -21,6 +23,7 @@ class App extends Component {
       banners: [],  // null represent "Loading" state, will be replaced by Array on server response
       products: null,  // null represent "Loading" state, will be replaced by Array on server response
       term: '',
+      searchResults: null,  // {term, products} found by the server for the last finished search
       cart: [],
       quickViewProduct: null,  // will be replaced by selected product attributes
       showCart: false,
@@ -62,6 +65,15 @@ class App extends Component {
 
     let csrfToken = document.querySelector("[name=csrfmiddlewaretoken]").value;
 
+    // Retries of the same checkout reuse the key, so the server creates the order only once
+    let body = JSON.stringify(data);
+    if (!this.checkoutAttempt || this.checkoutAttempt.body !== body){
+      this.checkoutAttempt = {
+        body,
+        idempotencyKey: `${Date.now()}-${Math.random().toString(36).slice(2)}`,
+      };
+    }
+
     try {
       let response = await fetch(url, {
         method: 'post',
@@ -69,8 +81,9 @@ class App extends Component {
           'Accept': 'application/json',
           'Content-Type': 'application/json',
           'X-CSRFToken': csrfToken,
+          'Idempotency-Key': this.checkoutAttempt.idempotencyKey,
         },
-        body: JSON.stringify(data),
+        body: body,
       });
 
       if (!response.ok){
@@ -79,6 +92,7 @@ class App extends Component {
       }
       let responseData = await response.json();
 
+      this.checkoutAttempt = null;
       this.setState({
         cart: [],
       });
@@ -145,7 +159,34 @@ class App extends Component {
 
   // Search by Keyword
   handleSearch(event){
-    this.setState({term: event.target.value});
+    let term = event.target.value;
+    this.setState({term: term});
+
+    clearTimeout(this.searchTimeout);
+    if (_.trim(term)){
+      this.searchTimeout = setTimeout(() => this.searchProducts(term), SEARCH_DELAY);
+    }
+  }
+
+  async searchProducts(term){
+    let response = await fetch(`/api/products/search/?q=${encodeURIComponent(term)}`, {
+      headers: {
+        'Accept': 'application/json',
+        'Content-Type': 'application/json',
+      }
+    });
+
+    if (!response.ok){
+      return;
+    }
+
+    let data = await response.json();
+    // An answer to an older search may come after the customer typed more
+    if (term === this.state.term){
+      this.setState({
+        searchResults: {term, products: data}
+      });
+    }
   }
 
   handleCartClose() {
@@ -221,7 +262,13 @@ class App extends Component {
       let filteredProducts = this.state.products;
 
       if (normalizedTerm){
-        filteredProducts = this.state.products.filter(product => !normalizedTerm || product.name.toLowerCase().includes(normalizedTerm));
+        let searchResults = this.state.searchResults;
+        if (searchResults && searchResults.term === this.state.term){
+          filteredProducts = searchResults.products;
+        } else {
+          // Filter the menu at hand until the server answers
+          filteredProducts = this.state.products.filter(product => product.name.toLowerCase().includes(normalizedTerm));
+        }
       } else {
         let highlightedProducts = this.state.products.filter(x => x.special_status);
 
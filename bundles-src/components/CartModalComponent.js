@@ -22,11 +22,12 @@ class CartModalComponent extends Component{
       maxWidth: "100px",
       maxHeight: "50px"
     };
+    const getThumbnail = product => ((product.thumbnails || {}).jpeg || {})['100'] || product.image;
 
     let cartItems = this.props.cartItems.map(product => (
       <CSSTransition classNames="fadeIn" key={product.id} timeout={{ enter:500, exit: 300 }}>
         <tr>
-          <td><img src={product.image} style={imgStyle} /></td>
+          <td><img src={getThumbnail(product)} style={imgStyle} /></td>
           <td>{product.name}</td>
           <td className="currency">{product.price}</td>
           <td>{product.quantity} шт.</td>
@@ -1,6 +1,8 @@
 import React, {Component} from 'react';
 import Counter from './Counter';
 
+const IMAGE_SIZES = "(max-width: 600px) 50vw, 300px";
+
 class Product extends Component{
   state = {
     isAdded: false,
@@ -39,13 +41,24 @@ class Product extends Component{
 
   render(){
     let image = this.props.product.image;
+    let srcset = this.props.product.srcset || {};
     let name = this.props.product.name;
     let price = this.props.product.price;
     let id = this.props.product.id;
     return (
       <div className="product">
         <div className="product-image">
-          <img src={image} alt={name} onClick={this.quickView.bind(this)}/>
+          <picture>
+            {srcset.webp && <source type="image/webp" srcSet={srcset.webp} sizes={IMAGE_SIZES}/>}
+            <img
+              src={image}
+              srcSet={srcset.jpeg}
+              sizes={IMAGE_SIZES}
+              alt={name}
+              loading="lazy"
+              onClick={this.quickView.bind(this)}
+            />
+          </picture>
         </div>
         <h4 className="product-name">{name}</h4>
         <p className="product-price currency">{price}</p>
@@ -4,17 +4,39 @@ from django.templatetags.static import static
 from django.utils.html import format_html
 from django.http import HttpResponseRedirect
 
+from .models import Banner
 from .models import Product
 from .models import ProductCategory
 from .models import Restaurant
 from .models import RestaurantMenuItem
 from .models import Order, ProductQuantity
+from .search import filter_products
+from .thumbnails import ADMIN_THUMBNAIL_WIDTH, get_thumbnail_urls
 
 
-class RestaurantMenuItemInline(admin.TabularInline):
+class SharedChoicesInlineMixin:
+    """Query choices of foreign keys once per request instead of once per inline form."""
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        formfield = super().formfield_for_foreignkey(db_field, request, **kwargs)
+        if formfield is None:
+            return formfield
+
+        shared_choices = request.__dict__.setdefault('_shared_admin_choices', {})
+        choices_key = (self.model._meta.label, db_field.name)
+        if choices_key not in shared_choices:
+            shared_choices[choices_key] = list(formfield.choices)
+        formfield.choices = shared_choices[choices_key]
+        return formfield
+
+
+class RestaurantMenuItemInline(SharedChoicesInlineMixin, admin.TabularInline):
     model = RestaurantMenuItem
     extra = 0
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('restaurant', 'product')
+
 
 @admin.register(Restaurant)
 class RestaurantAdmin(admin.ModelAdmin):
@@ -41,17 +63,20 @@ class ProductAdmin(admin.ModelAdmin):
         'category',
         'price',
     ]
+    list_select_related = [
+        'category',
+    ]
     list_display_links = [
         'name',
     ]
     list_filter = [
         'category',
     ]
+    # Searched through the full-text index, see get_search_results
     search_fields = [
-        # FIXME SQLite can not convert letter case for cyrillic words properly, so search will be buggy.
-        # Migration to PostgreSQL is necessary
         'name',
         'category__name',
+        'description',
     ]
 
     inlines = [
@@ -89,6 +114,9 @@ class ProductAdmin(admin.ModelAdmin):
             )
         }
 
+    def get_search_results(self, request, queryset, search_term):
+        return filter_products(queryset, search_term), False
+
     def get_image_preview(self, obj):
         if not obj.image:
             return 'выберите картинку'
@@ -99,7 +127,8 @@ class ProductAdmin(admin.ModelAdmin):
         if not obj.image or not obj.id:
             return 'нет картинки'
         edit_url = reverse('admin:foodcartapp_product_change', args=(obj.id,))
-        return format_html('<a href="{edit_url}"><img src="{src}" style="max-height: 50px;"/></a>', edit_url=edit_url, src=obj.image.url)
+        src = get_thumbnail_urls(obj).get('jpeg', {}).get(str(ADMIN_THUMBNAIL_WIDTH), obj.image.url)
+        return format_html('<a href="{edit_url}"><img src="{src}" style="max-height: 50px;"/></a>', edit_url=edit_url, src=src)
     get_image_list_preview.short_description = 'превью'
 
 
@@ -108,16 +137,54 @@ class ProductAdmin(admin.ModelAdmin):
     pass
 
 
-class ProductQuantityInline(admin.TabularInline):
+@admin.register(Banner)
+class BannerAdmin(admin.ModelAdmin):
+    list_display = [
+        'get_image_list_preview',
+        'title',
+        'position',
+        'is_active',
+        'starts_at',
+        'ends_at',
+    ]
+    list_display_links = [
+        'title',
+    ]
+    list_editable = [
+        'position',
+        'is_active',
+    ]
+    list_filter = [
+        'is_active',
+    ]
+
+    def get_image_list_preview(self, obj):
+        if not obj.image:
+            return 'нет картинки'
+        return format_html('<img src="{src}" style="max-height: 50px;"/>', src=obj.image.url)
+    get_image_list_preview.short_description = 'превью'
+
+
+class ProductQuantityInline(SharedChoicesInlineMixin, admin.TabularInline):
     model = ProductQuantity
     extra = 0
+    fields = ['product', 'quantity', 'unit_price', 'line_total']
+    readonly_fields = ['line_total']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product')
 
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ['firstname', 'status', 'payment_method', 'lastname', 'address', 'phonenumber', 'called_at', 'delivered_at']
+    list_display = ['firstname', 'status', 'payment_method', 'lastname', 'address', 'phonenumber', 'total_price', 'called_at', 'delivered_at']
+    readonly_fields = ['total_price']
     inlines = [ProductQuantityInline,]
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        Order.objects.filter(pk=form.instance.pk).update_total_prices()
+
     def response_post_save_change(self, request, obj):
         res = super().response_post_save_change(request, obj)
         if 'next' in request.GET:
@@ -0,0 +1,212 @@
+"""Write-behind buffer for incoming orders.
+
+Accepted orders are appended as JSON lines to segment files in ORDER_INTAKE_DIR.
+Every process writes to its own segment, and a new segment is started every
+ORDER_INTAKE_SEGMENT_SECONDS. The drain_order_intake command inserts closed
+segments into the database in batches and then deletes them. Orders that can
+not be inserted, e.g. because a product was deleted meanwhile, are moved to
+the failed subdirectory, so they do not block the rest of the intake.
+"""
+import json
+import logging
+import os
+import re
+import socket
+import threading
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import DataError, IntegrityError, transaction
+from django.db.models import Case, DateTimeField, Value, When
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Order, OrderEvent, ProductQuantity
+
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_SUFFIX = '.jsonl'
+SEGMENT_GRACE_SECONDS = 2
+SEGMENT_NAME_PATTERN = re.compile(r'^(?P<bucket>\d+)-.+\.jsonl$')
+FAILED_DIR_NAME = 'failed'
+
+# Errors caused by the record itself, retrying it later would fail the same way
+RECORD_ERRORS = (IntegrityError, DataError, LookupError, TypeError, ValueError, ArithmeticError)
+
+_append_lock = threading.Lock()
+
+
+def get_segment_bucket(at):
+    return int(at // settings.ORDER_INTAKE_SEGMENT_SECONDS)
+
+
+def get_segment_path(bucket):
+    filename = f'{bucket:012d}-{socket.gethostname()}-{os.getpid()}{SEGMENT_SUFFIX}'
+    return os.path.join(settings.ORDER_INTAKE_DIR, filename)
+
+
+def append_order(order, product_quantities):
+    """Durably append the order with its lines to the current segment."""
+    record = {
+        'intake_id': str(order.intake_id),
+        'created_at': timezone.now().isoformat(),
+        'firstname': order.firstname,
+        'lastname': order.lastname,
+        'phonenumber': str(order.phonenumber),
+        'address': order.address,
+        'products': [
+            {
+                'product': product_quantity.product_id,
+                'quantity': product_quantity.quantity,
+                'unit_price': str(product_quantity.unit_price),
+                'line_total': str(product_quantity.line_total),
+            }
+            for product_quantity in product_quantities
+        ],
+    }
+    line = (json.dumps(record, ensure_ascii=False) + '\n').encode()
+
+    os.makedirs(settings.ORDER_INTAKE_DIR, exist_ok=True)
+    with _append_lock:
+        segment_path = get_segment_path(get_segment_bucket(time.time()))
+        file_descriptor = os.open(segment_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(file_descriptor, line)
+            if settings.ORDER_INTAKE_FSYNC:
+                os.fsync(file_descriptor)
+        finally:
+            os.close(file_descriptor)
+
+
+def get_closed_segments():
+    """Segments nobody writes to anymore, oldest first."""
+    if not os.path.isdir(settings.ORDER_INTAKE_DIR):
+        return []
+
+    current_bucket = get_segment_bucket(time.time() - SEGMENT_GRACE_SECONDS)
+    segments = []
+    for filename in sorted(os.listdir(settings.ORDER_INTAKE_DIR)):
+        match = SEGMENT_NAME_PATTERN.match(filename)
+        if not match:
+            continue
+        if int(match['bucket']) < current_bucket:
+            segments.append(os.path.join(settings.ORDER_INTAKE_DIR, filename))
+    return segments
+
+
+def read_segment(segment_path):
+    records = []
+    with open(segment_path, encoding='utf-8') as segment:
+        for line_number, line in enumerate(segment, start=1):
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                logger.error('Skipped broken line %s of order intake segment %s', line_number, segment_path)
+    return records
+
+
+def insert_orders(records):
+    """Insert buffered orders with multi-row inserts, skipping already inserted ones."""
+    unique_records = {}
+    for record in records:
+        # A repeated intake id is a retry, the first record is the one that was acknowledged
+        unique_records.setdefault(record['intake_id'], record)
+    records = unique_records
+    with transaction.atomic():
+        inserted_ids = set(
+            str(intake_id) for intake_id in
+            Order.objects.filter(intake_id__in=records).values_list('intake_id', flat=True)
+        )
+        new_records = [record for intake_id, record in records.items() if intake_id not in inserted_ids]
+        if not new_records:
+            return 0
+
+        orders = [
+            Order(
+                intake_id=record['intake_id'],
+                firstname=record['firstname'],
+                lastname=record['lastname'],
+                phonenumber=record['phonenumber'],
+                address=record['address'],
+                total_price=sum(Decimal(item['line_total']) for item in record['products']),
+            )
+            for record in new_records
+        ]
+        Order.objects.bulk_create(orders)
+        order_ids = {
+            str(intake_id): order_id for intake_id, order_id in
+            Order.objects.filter(intake_id__in=[record['intake_id'] for record in new_records]).values_list('intake_id', 'id')
+        }
+        Order.objects.filter(pk__in=order_ids.values()).update(created_at=Case(
+            *[
+                When(pk=order_ids[record['intake_id']], then=Value(parse_datetime(record['created_at'])))
+                for record in new_records
+            ],
+            output_field=DateTimeField(),
+        ))
+        ProductQuantity.objects.bulk_create([
+            ProductQuantity(
+                order_id=order_ids[record['intake_id']],
+                product_id=item['product'],
+                quantity=item['quantity'],
+                unit_price=Decimal(item['unit_price']),
+                line_total=Decimal(item['line_total']),
+            )
+            for record in new_records
+            for item in record['products']
+        ])
+
+        # bulk_create skips the signals that record order events
+        for order in orders:
+            order.pk = order_ids[str(order.intake_id)]
+        OrderEvent.objects.bulk_create([OrderEvent.build(order, OrderEvent.Kind.CREATED) for order in orders])
+    return len(new_records)
+
+
+def move_to_failed(segment_path, records):
+    failed_dir = os.path.join(settings.ORDER_INTAKE_DIR, FAILED_DIR_NAME)
+    os.makedirs(failed_dir, exist_ok=True)
+    failed_path = os.path.join(failed_dir, os.path.basename(segment_path))
+    with open(failed_path, 'a', encoding='utf-8') as failed_segment:
+        for record in records:
+            failed_segment.write(json.dumps(record, ensure_ascii=False) + '\n')
+    return failed_path
+
+
+def insert_batch(segment_path, records):
+    """Insert the batch, falling back to one order at a time to find the ones that fail.
+
+    Returns the number of inserted orders and the records that could not be inserted.
+    """
+    try:
+        return insert_orders(records), []
+    except RECORD_ERRORS:
+        if len(records) == 1:
+            logger.exception('Could not insert order %s from %s', records[0].get('intake_id'), segment_path)
+            return 0, records
+
+    inserted_count, failed_records = 0, []
+    for record in records:
+        record_inserted_count, record_failed = insert_batch(segment_path, [record])
+        inserted_count += record_inserted_count
+        failed_records += record_failed
+    return inserted_count, failed_records
+
+
+def drain(batch_size):
+    """Insert all closed segments into the database and delete them."""
+    inserted_count = 0
+    for segment_path in get_closed_segments():
+        records = read_segment(segment_path)
+        failed_records = []
+        for start in range(0, len(records), batch_size):
+            batch_inserted_count, batch_failed = insert_batch(segment_path, records[start:start + batch_size])
+            inserted_count += batch_inserted_count
+            failed_records += batch_failed
+        if failed_records:
+            failed_path = move_to_failed(segment_path, failed_records)
+            logger.error('Moved %s orders that could not be inserted to %s', len(failed_records), failed_path)
+        os.remove(segment_path)
+    return inserted_count
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from foodcartapp.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Recalculate stored order totals from order lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='How many orders to update in one query')
+
+    def handle(self, *args, **options):
+        updated_count = 0
+        last_id = 0
+        while True:
+            order_ids = list(
+                Order.objects
+                .filter(pk__gt=last_id)
+                .order_by('pk')
+                .values_list('pk', flat=True)[:options['batch_size']]
+            )
+            if not order_ids:
+                break
+            # Totals only get their stored form, so the orders are not reported as changed
+            updated_count += Order.objects.filter(pk__in=order_ids).update_total_prices(mark_changed=False)
+            last_id = order_ids[-1]
+        self.stdout.write(f'Updated {updated_count} orders')
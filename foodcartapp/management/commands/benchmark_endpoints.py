@@ -0,0 +1,147 @@
+import json
+import platform
+import statistics
+import time
+import tracemalloc
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from foodcartapp.models import Order, Product, Restaurant
+from location.models import Location
+
+
+BENCHMARK_USERNAME = 'benchmark'
+
+
+def get_percentile(values, percent):
+    values = sorted(values)
+    index = min(len(values) - 1, round(percent / 100 * (len(values) - 1)))
+    return values[index]
+
+
+class Command(BaseCommand):
+    help = 'Time the main endpoints on the current database and write a JSON report'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=10, help='How many times to request every endpoint')
+        parser.add_argument('--output', default='benchmark.json', help='Where to write the report')
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat must be at least 1')
+        if settings.DEBUG:
+            self.stderr.write('DEBUG is on, the numbers include debug_toolbar overhead. Run with DEBUG=False.')
+
+        host = next((host for host in settings.ALLOWED_HOSTS if '*' not in host), 'localhost').lstrip('.')
+        anonymous_client = Client(HTTP_HOST=host)
+        manager_client = Client(HTTP_HOST=host)
+        manager, _ = get_user_model().objects.get_or_create(
+            username=BENCHMARK_USERNAME,
+            defaults={'is_staff': True},
+        )
+        manager_client.force_login(manager)
+        order_payload = self.get_order_payload()
+
+        endpoints = [
+            ('GET /api/products/', lambda: anonymous_client.get('/api/products/')),
+            ('POST /api/order/', lambda: anonymous_client.post(
+                '/api/order/',
+                order_payload,
+                content_type='application/json',
+            )),
+            ('GET /manager/orders/', lambda: manager_client.get('/manager/orders/')),
+            ('GET /manager/products/', lambda: manager_client.get('/manager/products/')),
+        ]
+
+        report = {
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'debug': settings.DEBUG,
+                'cache': settings.CACHES['default']['BACKEND'],
+            },
+            'dataset': {
+                'restaurants': Restaurant.objects.count(),
+                'products': Product.objects.count(),
+                'orders': Order.objects.count(),
+                'locations': Location.objects.count(),
+            },
+            'endpoints': {},
+        }
+        for name, send_request in endpoints:
+            report['endpoints'][name] = self.measure(send_request, options['repeat'])
+            self.stdout.write(
+                f'{name}: median {report["endpoints"][name]["wall_time_ms"]["median"]} ms, '
+                f'{report["endpoints"][name]["queries"]} queries, '
+                f'peak {report["endpoints"][name]["peak_memory_kb"]} KiB'
+            )
+
+        with open(options['output'], 'w') as report_file:
+            json.dump(report, report_file, indent=2, ensure_ascii=False)
+        self.stdout.write(f'Report is written to {options["output"]}')
+
+    def get_order_payload(self):
+        product_id = Product.objects.filter(
+            menu_items__availability=True,
+        ).order_by('?').values_list('pk', flat=True).first()
+        address = Location.objects.exclude(lat=None).order_by('?').values_list('address', flat=True).first()
+        if product_id is None or address is None:
+            raise CommandError('Nothing to order, fill the database with generate_dataset first')
+        return {
+            'products': [{'product': product_id, 'quantity': 1}],
+            'firstname': 'Бенчмарк',
+            'lastname': 'Бенчмарков',
+            'phonenumber': '+79000000000',
+            'address': address,
+        }
+
+    def measure(self, send_request, repeat):
+        """Time a cold request and repeated warm ones, then rerun under tracemalloc for peak memory."""
+        cache.clear()
+        wall_times = []
+        reset_queries()
+        with CaptureQueriesContext(connection) as cold_queries:
+            started_at = time.perf_counter()
+            response = send_request()
+            cold_wall_time = time.perf_counter() - started_at
+        cold_query_count = len(cold_queries)
+        if response.status_code >= 400:
+            raise CommandError(f'Request failed with status {response.status_code}')
+
+        for _ in range(repeat):
+            reset_queries()
+            with CaptureQueriesContext(connection) as warm_queries:
+                started_at = time.perf_counter()
+                response = send_request()
+                wall_times.append(time.perf_counter() - started_at)
+            query_count = len(warm_queries)
+
+        tracemalloc.start()
+        try:
+            send_request()
+            _, peak_memory = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        return {
+            'status': response.status_code,
+            'response_bytes': len(response.content),
+            'cold_wall_time_ms': round(cold_wall_time * 1000, 2),
+            'cold_queries': cold_query_count,
+            'wall_time_ms': {
+                'min': round(min(wall_times) * 1000, 2),
+                'median': round(statistics.median(wall_times) * 1000, 2),
+                'p95': round(get_percentile(wall_times, 95) * 1000, 2),
+                'max': round(max(wall_times) * 1000, 2),
+            },
+            'queries': query_count,
+            'peak_memory_kb': round(peak_memory / 1024),
+        }
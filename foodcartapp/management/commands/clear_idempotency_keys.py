@@ -0,0 +1,16 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from foodcartapp.models import OrderIdempotencyKey
+
+
+class Command(BaseCommand):
+    help = 'Delete order idempotency keys older than ORDER_IDEMPOTENCY_KEY_TTL'
+
+    def handle(self, *args, **options):
+        expired_before = timezone.now() - timedelta(seconds=settings.ORDER_IDEMPOTENCY_KEY_TTL)
+        deleted_count, _ = OrderIdempotencyKey.objects.filter(created_at__lt=expired_before).delete()
+        self.stdout.write(f'Deleted {deleted_count} idempotency keys')
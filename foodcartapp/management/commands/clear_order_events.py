@@ -0,0 +1,16 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from foodcartapp.models import OrderEvent
+
+
+class Command(BaseCommand):
+    help = 'Delete order events older than ORDER_EVENT_TTL'
+
+    def handle(self, *args, **options):
+        expired_before = timezone.now() - timedelta(seconds=settings.ORDER_EVENT_TTL)
+        deleted_count, _ = OrderEvent.objects.filter(created_at__lt=expired_before).delete()
+        self.stdout.write(f'Deleted {deleted_count} order events')
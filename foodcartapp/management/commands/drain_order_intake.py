@@ -0,0 +1,35 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError
+
+from foodcartapp.intake import drain
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Insert orders accepted in buffered intake mode into the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200, help='How many orders to insert in one transaction')
+        parser.add_argument('--loop', action='store_true', help='Keep draining instead of exiting when done')
+        parser.add_argument('--interval', type=float, default=1, help='Seconds to sleep between passes with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                inserted_count = drain(options['batch_size'])
+            except DatabaseError:
+                if not options['loop']:
+                    raise
+                # The database is unavailable, segments stay in place until the next pass
+                logger.exception('Could not drain order intake')
+                inserted_count = 0
+            if inserted_count or not options['loop']:
+                self.stdout.write(f'Inserted {inserted_count} orders')
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
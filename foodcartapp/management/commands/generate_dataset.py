@@ -0,0 +1,188 @@
+import io
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from PIL import Image
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Case, DateTimeField, Value, When
+from django.utils import timezone
+
+from foodcartapp.models import Order, Product, ProductCategory, ProductQuantity, Restaurant, RestaurantMenuItem
+from foodcartapp.search import update_search_index
+from foodcartapp.versions import bump_version
+from location.models import Location
+from location.normalization import normalize_address
+
+
+STREETS = [
+    'ул. Тверская', 'ул. Арбат', 'пр-т Мира', 'Ленинский пр-т', 'ул. Покровка', 'ул. Маросейка',
+    'Кутузовский пр-т', 'ул. Большая Ордынка', 'ул. Пятницкая', 'Садовая-Кудринская ул.',
+    'ул. Новый Арбат', 'Профсоюзная ул.', 'ул. Лесная', 'Варшавское ш.', 'ул. Бауманская',
+]
+FIRST_NAMES = ['Иван', 'Мария', 'Пётр', 'Анна', 'Сергей', 'Ольга', 'Дмитрий', 'Елена', 'Алексей', 'Наталья']
+LAST_NAMES = ['Иванов', 'Смирнова', 'Кузнецов', 'Попова', 'Васильев', 'Петрова', 'Соколов', 'Михайлова']
+CATEGORIES = ['Бургеры', 'Роллы', 'Напитки', 'Десерты', 'Закуски', 'Салаты', 'Супы', 'Соусы']
+PRODUCT_WORDS = ['Классический', 'Острый', 'Двойной', 'Сырный', 'Фирменный', 'Детский', 'Большой', 'Веган']
+
+MOSCOW_CENTER = (55.7522, 37.6156)
+PLACEHOLDER_IMAGE_NAME = 'dataset/placeholder.png'
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = 'Fill the database with synthetic restaurants, products, menus, orders and geocoded locations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--restaurants', type=int, default=10, help='How many restaurants to create')
+        parser.add_argument('--products', type=int, default=100, help='How many products to create')
+        parser.add_argument('--orders', type=int, default=1000, help='How many historical orders to create')
+        parser.add_argument('--max-lines', type=int, default=5, help='Maximum number of lines in an order')
+        parser.add_argument('--menu-coverage', type=float, default=0.8, help='Share of products on every restaurant menu')
+        parser.add_argument('--open-orders', type=float, default=0.1, help='Share of orders that are not done yet')
+        parser.add_argument('--days', type=int, default=90, help='Spread order creation dates over this many days')
+        parser.add_argument('--seed', type=int, default=None, help='Random seed to get the same dataset again')
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+
+        with transaction.atomic():
+            restaurants = self.create_restaurants(options['restaurants'])
+            products = self.create_products(options['products'])
+            self.create_menus(restaurants, products, options['menu_coverage'])
+        order_addresses = self.create_orders(
+            products,
+            options['orders'],
+            options['max_lines'],
+            options['open_orders'],
+            timedelta(days=options['days']),
+        )
+        self.create_locations([restaurant.address for restaurant in restaurants] + order_addresses)
+
+        # bulk_create skips the signals that drop cached menus and catalog and index products
+        update_search_index([product.id for product in products])
+        bump_version('menu')
+        bump_version('catalog')
+
+        self.stdout.write(
+            f'Created {len(restaurants)} restaurants, {len(products)} products '
+            f'and {options["orders"]} orders'
+        )
+
+    def get_address(self):
+        return f'Москва, {self.random.choice(STREETS)}, д. {self.random.randint(1, 150)}'
+
+    def get_placeholder_image(self):
+        if not default_storage.exists(PLACEHOLDER_IMAGE_NAME):
+            image_file = io.BytesIO()
+            Image.new('RGB', (400, 300), (230, 160, 60)).save(image_file, 'PNG')
+            default_storage.save(PLACEHOLDER_IMAGE_NAME, ContentFile(image_file.getvalue()))
+        return PLACEHOLDER_IMAGE_NAME
+
+    def create_restaurants(self, count):
+        first_id = (Restaurant.objects.order_by('-pk').values_list('pk', flat=True).first() or 0) + 1
+        Restaurant.objects.bulk_create([
+            Restaurant(
+                name=f'Star Burger {first_id + number}',
+                address=self.get_address(),
+                contact_phone=f'+7 495 {self.random.randint(100, 999)} {self.random.randint(10, 99)} {self.random.randint(10, 99)}',
+            )
+            for number in range(count)
+        ])
+        return list(Restaurant.objects.filter(pk__gte=first_id).order_by('pk'))
+
+    def create_products(self, count):
+        categories = list(ProductCategory.objects.filter(name__in=CATEGORIES))
+        missing_categories = set(CATEGORIES) - {category.name for category in categories}
+        if missing_categories:
+            ProductCategory.objects.bulk_create([ProductCategory(name=name) for name in sorted(missing_categories)])
+            categories = list(ProductCategory.objects.filter(name__in=CATEGORIES))
+
+        image = self.get_placeholder_image()
+        first_id = (Product.objects.order_by('-pk').values_list('pk', flat=True).first() or 0) + 1
+        Product.objects.bulk_create([
+            Product(
+                name=f'{self.random.choice(PRODUCT_WORDS)} {first_id + number}',
+                category=self.random.choice(categories),
+                price=Decimal(self.random.randint(99, 999)),
+                image=image,
+                special_status=self.random.random() < 0.1,
+                description='Синтетический товар для нагрузочного тестирования',
+            )
+            for number in range(count)
+        ])
+        return list(Product.objects.filter(pk__gte=first_id).order_by('pk'))
+
+    def create_menus(self, restaurants, products, coverage):
+        menu_size = max(1, round(len(products) * coverage))
+        RestaurantMenuItem.objects.bulk_create([
+            RestaurantMenuItem(restaurant=restaurant, product=product, availability=self.random.random() < 0.95)
+            for restaurant in restaurants
+            for product in self.random.sample(products, min(menu_size, len(products)))
+        ])
+
+    def create_orders(self, products, count, max_lines, open_share, period):
+        now = timezone.now()
+        addresses = []
+        for batch_start in range(0, count, BATCH_SIZE):
+            batch_size = min(BATCH_SIZE, count - batch_start)
+            orders = []
+            orders_lines = []
+            for _ in range(batch_size):
+                lines = [
+                    (product, self.random.randint(1, 3))
+                    for product in self.random.sample(products, self.random.randint(1, min(max_lines, len(products))))
+                ]
+                address = self.get_address()
+                addresses.append(address)
+                is_open = self.random.random() < open_share
+                orders.append(Order(
+                    address=address,
+                    firstname=self.random.choice(FIRST_NAMES),
+                    lastname=self.random.choice(LAST_NAMES),
+                    phonenumber=f'+79{self.random.randint(0, 999999999):09d}',
+                    status=self.random.choice([Order.OrderStatus.UNPROCESSED, Order.OrderStatus.IN_PROGRESS]) if is_open else Order.OrderStatus.DONE,
+                    payment_method=self.random.choice(Order.PaymentMethod.values),
+                    total_price=sum(product.price * quantity for product, quantity in lines),
+                ))
+                orders_lines.append(lines)
+
+            with transaction.atomic():
+                Order.objects.bulk_create(orders)
+                order_ids = list(Order.objects.order_by('-pk').values_list('pk', flat=True)[:batch_size])[::-1]
+                Order.objects.filter(pk__in=order_ids).update(created_at=Case(
+                    *[When(pk=order_id, then=Value(now - period * self.random.random())) for order_id in order_ids],
+                    output_field=DateTimeField(),
+                ))
+                ProductQuantity.objects.bulk_create([
+                    ProductQuantity(
+                        order_id=order_id,
+                        product=product,
+                        quantity=quantity,
+                        unit_price=product.price,
+                        line_total=product.price * quantity,
+                    )
+                    for order_id, lines in zip(order_ids, orders_lines)
+                    for product, quantity in lines
+                ])
+        return addresses
+
+    def create_locations(self, addresses):
+        center_lat, center_lng = MOSCOW_CENTER
+        Location.objects.bulk_create(
+            [
+                Location(
+                    address=address,
+                    normalized_address=normalize_address(address),
+                    lat=center_lat + self.random.uniform(-0.15, 0.15),
+                    lng=center_lng + self.random.uniform(-0.25, 0.25),
+                )
+                for address in {normalize_address(address): address for address in addresses}.values()
+            ],
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from foodcartapp.models import Product
+from foodcartapp.thumbnails import update_image_variants
+from foodcartapp.versions import bump_version
+
+
+class Command(BaseCommand):
+    help = 'Make thumbnails for product images that do not have them yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Make thumbnails again even if they already exist')
+
+    def handle(self, *args, **options):
+        updated_count = 0
+        failed_products = []
+        # Products sharing an image share its thumbnails, so they are encoded again only once
+        rewritten_images = set()
+        for product in Product.objects.only('name', 'image', 'image_variants').iterator():
+            overwrite = options['force'] and product.image.name not in rewritten_images
+            if not overwrite and product.image_variants.get('source') == product.image.name:
+                continue
+            if update_image_variants(product, overwrite):
+                updated_count += 1
+                rewritten_images.add(product.image.name)
+            else:
+                failed_products.append(product)
+
+        if updated_count:
+            bump_version('catalog')
+        self.stdout.write(f'Made thumbnails for {updated_count} products')
+        for product in failed_products:
+            self.stderr.write(f'Could not read image {product.image.name} of product {product.id} "{product.name}"')
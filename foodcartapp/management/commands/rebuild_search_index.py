@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from foodcartapp.models import Product
+from foodcartapp.search import update_search_index
+from foodcartapp.versions import bump_version
+
+
+class Command(BaseCommand):
+    help = 'Index all products for search again, e.g. after loaddata or raw SQL changes'
+
+    def handle(self, *args, **options):
+        update_search_index()
+        bump_version('catalog')
+        self.stdout.write(f'Indexed {Product.objects.count()} products')
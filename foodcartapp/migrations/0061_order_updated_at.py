@@ -0,0 +1,36 @@
+# Generated by Django 3.2.15 on 2026-10-18 04:53
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_updated_at(apps, schema_editor):
+    Order = apps.get_model('foodcartapp', 'Order')
+    Order.objects.update(updated_at=F('created_at'))
+
+
+def start_assigned_orders(apps, schema_editor):
+    Order = apps.get_model('foodcartapp', 'Order')
+    Order.objects.filter(status='UNPROCESSED', selected_restaurant__isnull=False).update(status='IN_PROGRESS')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0060_auto_20221227_1011'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='Дата изменения заказа'),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Дата создания заказа'),
+        ),
+        migrations.RunPython(fill_updated_at, migrations.RunPython.noop),
+        migrations.RunPython(start_assigned_orders, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+import os
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import migrations
+
+
+BANNERS = [
+    ('Burger', 'burger.jpg', 'Tasty Burger at your door step'),
+    ('Spices', 'food.jpg', 'All Cuisines'),
+    ('New York', 'tasty.jpg', 'Food is incomplete without a tasty dessert'),
+]
+
+
+def fill_banners(apps, schema_editor):
+    Banner = apps.get_model('foodcartapp', 'Banner')
+    if Banner.objects.exists():
+        return
+
+    for position, (title, filename, text) in enumerate(BANNERS):
+        image_name = f'banners/{filename}'
+        image_path = os.path.join(settings.BASE_DIR, 'assets', filename)
+        if not default_storage.exists(image_name):
+            if not os.path.exists(image_path):
+                continue
+            with open(image_path, 'rb') as image_file:
+                image_name = default_storage.save(image_name, File(image_file))
+        Banner.objects.create(title=title, text=text, image=image_name, position=position)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0063_banner'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_banners, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.15 on 2026-10-18 04:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0065_orderidempotencykey'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='intake_id',
+            field=models.UUIDField(editable=False, null=True, unique=True, verbose_name='Идентификатор в буфере приёма заказов'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+from decimal import Decimal
+
+import django.core.validators
+from django.db import migrations, models
+
+
+BATCH_SIZE = 1000
+
+
+def fill_unit_price(apps, schema_editor):
+    # Computed in Python: SQLite divides the decimal columns as integers
+    ProductQuantity = apps.get_model('foodcartapp', 'ProductQuantity')
+    product_quantities = ProductQuantity.objects.only('line_total', 'quantity').order_by('pk')
+    batch = []
+    for product_quantity in product_quantities.iterator(chunk_size=BATCH_SIZE):
+        # A line without quantity keeps its total as the price of one item
+        unit_price = product_quantity.line_total / (product_quantity.quantity or 1)
+        product_quantity.unit_price = unit_price.quantize(Decimal('0.01'))
+        batch.append(product_quantity)
+        if len(batch) == BATCH_SIZE:
+            ProductQuantity.objects.bulk_update(batch, ['unit_price'])
+            batch = []
+    ProductQuantity.objects.bulk_update(batch, ['unit_price'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0067_order_total_price'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='productquantity',
+            old_name='price',
+            new_name='line_total',
+        ),
+        migrations.AlterField(
+            model_name='productquantity',
+            name='line_total',
+            field=models.DecimalField(decimal_places=2, max_digits=8, validators=[django.core.validators.MinValueValidator(0)], verbose_name='Стоимость'),
+        ),
+        migrations.AddField(
+            model_name='productquantity',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, max_digits=8, null=True, verbose_name='Цена за штуку'),
+        ),
+        migrations.RunPython(fill_unit_price, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='productquantity',
+            name='unit_price',
+            field=models.DecimalField(blank=True, decimal_places=2, help_text='Если не указать, возьмётся текущая цена продукта', max_digits=8, validators=[django.core.validators.MinValueValidator(0)], verbose_name='Цена за штуку'),
+        ),
+    ]
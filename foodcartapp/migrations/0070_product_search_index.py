@@ -0,0 +1,68 @@
+from django.db import migrations
+
+
+SQLITE_CREATE_SQL = [
+    # remove_diacritics 2 lets "cafe" find "café", prefix indexes keep short prefix queries fast
+    """
+    CREATE VIRTUAL TABLE foodcartapp_productsearch USING fts5(
+        name, category, description,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+    """,
+    """
+    INSERT INTO foodcartapp_productsearch (rowid, name, category, description)
+    SELECT
+        product.id,
+        REPLACE(REPLACE(COALESCE(product.name, ''), 'ё', 'е'), 'Ё', 'Е'),
+        REPLACE(REPLACE(COALESCE(category.name, ''), 'ё', 'е'), 'Ё', 'Е'),
+        REPLACE(REPLACE(COALESCE(product.description, ''), 'ё', 'е'), 'Ё', 'Е')
+    FROM foodcartapp_product product
+    LEFT JOIN foodcartapp_productcategory category ON category.id = product.category_id
+    """,
+]
+
+POSTGRESQL_CREATE_SQL = [
+    """
+    CREATE TABLE foodcartapp_productsearch (
+        product_id integer PRIMARY KEY REFERENCES foodcartapp_product (id) ON DELETE CASCADE,
+        document tsvector NOT NULL
+    )
+    """,
+    'CREATE INDEX foodcartapp_productsearch_document_idx ON foodcartapp_productsearch USING GIN (document)',
+    """
+    INSERT INTO foodcartapp_productsearch (product_id, document)
+    SELECT
+        product.id,
+        setweight(to_tsvector('simple', REPLACE(REPLACE(COALESCE(product.name, ''), 'ё', 'е'), 'Ё', 'Е')), 'A')
+        || setweight(to_tsvector('simple', REPLACE(REPLACE(COALESCE(category.name, ''), 'ё', 'е'), 'Ё', 'Е')), 'B')
+        || setweight(to_tsvector('simple', REPLACE(REPLACE(COALESCE(product.description, ''), 'ё', 'е'), 'Ё', 'Е')), 'C')
+    FROM foodcartapp_product product
+    LEFT JOIN foodcartapp_productcategory category ON category.id = product.category_id
+    """,
+]
+
+
+def create_search_index(apps, schema_editor):
+    statements = {
+        'sqlite': SQLITE_CREATE_SQL,
+        'postgresql': POSTGRESQL_CREATE_SQL,
+    }.get(schema_editor.connection.vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute('DROP TABLE IF EXISTS foodcartapp_productsearch')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0069_product_image_variants'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
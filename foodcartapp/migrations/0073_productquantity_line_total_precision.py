@@ -0,0 +1,19 @@
+# Generated by Django 3.2.15 on 2026-10-18 05:46
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0072_order_updated_at_id_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='productquantity',
+            name='line_total',
+            field=models.DecimalField(decimal_places=2, max_digits=10, validators=[django.core.validators.MinValueValidator(0)], verbose_name='Стоимость'),
+        ),
+    ]
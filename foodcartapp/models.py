@@ -1,14 +1,25 @@
-import copy
+from collections import defaultdict
 
+from django.core.cache import cache
 from django.db import models
-from django.db.models import Sum, F
+from django.db.models import OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from django.core.validators import MinValueValidator
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 from functools import reduce
 
 from phonenumber_field.modelfields import PhoneNumberField
 
+from monitoring import metrics
+
+from .replicas import get_cache_timeout
+from .versions import get_version
+
+
+AVAILABILITY_INDEX_CACHE_TIMEOUT = 24 * 60 * 60
+
 
 class Restaurant(models.Model):
     name = models.CharField(
@@ -80,6 +91,12 @@ class Product(models.Model):
     image = models.ImageField(
         'картинка'
     )
+    image_variants = models.JSONField(
+        'уменьшенные копии картинки',
+        default=dict,
+        blank=True,
+        editable=False,
+    )
     special_status = models.BooleanField(
         'спец.предложение',
         default=False,
@@ -101,6 +118,18 @@ class Product(models.Model):
         return self.name
 
 
+class RestaurantMenuItemQuerySet(models.QuerySet):
+    def get_availability_index(self):
+        restaurants_by_product = defaultdict(set)
+        menu_items = self.filter(availability=True).values_list('product_id', 'restaurant_id')
+        for product_id, restaurant_id in menu_items:
+            restaurants_by_product[product_id].add(restaurant_id)
+        return {
+            product_id: frozenset(restaurant_ids)
+            for product_id, restaurant_ids in restaurants_by_product.items()
+        }
+
+
 class RestaurantMenuItem(models.Model):
     restaurant = models.ForeignKey(
         Restaurant,
@@ -120,6 +149,8 @@ class RestaurantMenuItem(models.Model):
         db_index=True
     )
 
+    objects = RestaurantMenuItemQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'пункт меню ресторана'
         verbose_name_plural = 'пункты меню ресторана'
@@ -131,18 +162,62 @@ class RestaurantMenuItem(models.Model):
         return f"{self.restaurant.name} - {self.product.name}"
 
 
+def get_availability_index():
+    """Map product id to the frozenset of restaurant ids that have it in stock.
+
+    The index is cached until the next change of restaurant menus.
+    """
+    cache_key = 'foodcartapp:availability_index:{}'.format(get_version('menu'))
+    availability_index = cache.get(cache_key)
+    metrics.record_cache_access('availability_index', hit=availability_index is not None)
+    if availability_index is None:
+        availability_index = RestaurantMenuItem.objects.get_availability_index()
+        cache.set(cache_key, availability_index, get_cache_timeout(AVAILABILITY_INDEX_CACHE_TIMEOUT))
+    return availability_index
+
+
 class OrderQuerySet(models.QuerySet):
-    def get_order_prices(self):
-        return self.annotate(order_price=Sum(F('ordered_items__price')*F('ordered_items__quantity')))
+    def after(self, created_at, order_id):
+        """Orders following the given one in (created_at, id) order."""
+        return self.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gt=order_id))
+
+    def changed_after(self, updated_at, order_id):
+        """Orders following the given one in (updated_at, id) order."""
+        return self.filter(Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, pk__gt=order_id))
+
+    def update_total_prices(self, mark_changed=True):
+        """Recalculate stored order totals from the order lines.
+
+        update() skips auto_now, so updated_at is set explicitly for the changes feed.
+        Backfills pass mark_changed=False to leave the orders out of the feed.
+        """
+        line_totals = (
+            ProductQuantity.objects
+            .filter(order=OuterRef('pk'))
+            .values('order')
+            .annotate(total=Sum('line_total'))
+            .values('total')
+        )
+        fields = {'total_price': Coalesce(Subquery(line_totals), Value(0), output_field=models.DecimalField())}
+        if mark_changed:
+            fields['updated_at'] = timezone.now()
+        return self.update(**fields)
 
     def get_accessible_restaurants(self):
-        items_menu = RestaurantMenuItem.objects.select_related('product', 'restaurant')
+        if not self:
+            return self
+
+        availability_index = get_availability_index()
+        restaurants = Restaurant.objects.in_bulk()
         for order in self:
-            ready_products = []
-            for order_product in order.ordered_items.all():
-                ready_products.append([item_menu.restaurant for item_menu in items_menu if order_product.product_id == item_menu.product.pk])
-            are_available_restaurants = reduce(set.intersection, map(set, ready_products))
-            order.are_available_restaurants = copy.deepcopy(are_available_restaurants)
+            restaurant_ids = [
+                availability_index.get(order_product.product_id, frozenset())
+                for order_product in order.ordered_items.all()
+            ]
+            accessible_ids = reduce(frozenset.intersection, restaurant_ids) if restaurant_ids else frozenset()
+            order.are_available_restaurants = [
+                restaurants[restaurant_id] for restaurant_id in accessible_ids if restaurant_id in restaurants
+            ]
         return self
 
 
@@ -167,13 +242,20 @@ class Order(models.Model):
     selected_restaurant = models.ForeignKey(Restaurant, null=True, blank=True, related_name='orders', verbose_name='Ресторан, который готовит заказ', on_delete=models.SET_NULL)
     called_at = models.DateTimeField('Время звонка', blank=True, null=True)
     delivered_at = models.DateTimeField('Время доставки', blank=True, null=True)
-    created_at = models.DateTimeField(verbose_name='Дата создания заказа', auto_now=True, db_index=True)
+    created_at = models.DateTimeField(verbose_name='Дата создания заказа', auto_now_add=True)
+    updated_at = models.DateTimeField(verbose_name='Дата изменения заказа', auto_now=True)
+    total_price = models.DecimalField('Стоимость заказа', max_digits=10, decimal_places=2, default=0, db_index=True, validators=[MinValueValidator(0)])
+    intake_id = models.UUIDField('Идентификатор в буфере приёма заказов', null=True, unique=True, editable=False)
 
     objects = OrderQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Заказ'
         verbose_name_plural = 'Заказы'
+        indexes = [
+            models.Index(fields=['created_at', 'id']),
+            models.Index(fields=['updated_at', 'id']),
+        ]
 
     def __str__(self):
         return '{} - {}'.format(self.lastname, self.address)
@@ -181,7 +263,8 @@ class Order(models.Model):
 
 class ProductQuantity(models.Model):
     quantity = models.PositiveIntegerField('Количество продукта', validators=[MinValueValidator(1)])
-    price = models.DecimalField('Цена', max_digits=8, decimal_places=2, validators=[MinValueValidator(0)])
+    unit_price = models.DecimalField('Цена за штуку', max_digits=8, decimal_places=2, blank=True, validators=[MinValueValidator(0)], help_text='Если не указать, возьмётся текущая цена продукта')
+    line_total = models.DecimalField('Стоимость', max_digits=10, decimal_places=2, validators=[MinValueValidator(0)])
     product = models.ForeignKey(Product, verbose_name='Продукт', related_name='ordered_items', on_delete=models.PROTECT)
     order = models.ForeignKey(Order, verbose_name='Заказ', related_name='ordered_items', on_delete=models.CASCADE)
 
@@ -189,6 +272,103 @@ class ProductQuantity(models.Model):
         verbose_name = 'Продукт - количество'
         verbose_name_plural = 'Продукты - количество'
 
-    @property
-    def order_price(self, save=True):
-        return self.quantity * self.product.price
+    def save(self, *args, **kwargs):
+        if self.unit_price is None:
+            self.unit_price = self.product.price
+        self.line_total = self.unit_price * self.quantity
+        super().save(*args, **kwargs)
+
+
+class OrderEvent(models.Model):
+    """Change of an order for live manager pages, the id serves as the cursor of the change feed."""
+
+    class Kind(models.TextChoices):
+        CREATED = 'created', _('Заказ создан')
+        STATUS_CHANGED = 'status_changed', _('Изменён статус')
+        RESTAURANT_ASSIGNED = 'restaurant_assigned', _('Назначен ресторан')
+
+    order = models.ForeignKey(Order, verbose_name='Заказ', related_name='events', on_delete=models.CASCADE)
+    kind = models.CharField('Событие', max_length=20, choices=Kind.choices)
+    payload = models.JSONField('Данные', default=dict)
+    created_at = models.DateTimeField('Время события', auto_now_add=True, db_index=True)
+
+    class Meta:
+        verbose_name = 'Событие заказа'
+        verbose_name_plural = 'События заказов'
+
+    def __str__(self):
+        return f'{self.get_kind_display()}: {self.order_id}'
+
+    @classmethod
+    def build(cls, order, kind):
+        restaurant = order.selected_restaurant if order.selected_restaurant_id else None
+        payload = {
+            'status': order.status,
+            'restaurant': {'id': restaurant.id, 'name': restaurant.name} if restaurant else None,
+        }
+        if kind == cls.Kind.CREATED:
+            payload.update({
+                'payment_method': order.payment_method,
+                'total_price': str(order.total_price),
+                'firstname': order.firstname,
+                'lastname': order.lastname,
+                'phonenumber': str(order.phonenumber),
+                'address': order.address,
+            })
+        return cls(order=order, kind=kind, payload=payload)
+
+
+class OrderIdempotencyKey(models.Model):
+    key = models.CharField('ключ', max_length=255, unique=True)
+    request_hash = models.CharField('хэш запроса', max_length=64)
+    response_status = models.PositiveSmallIntegerField('код ответа')
+    response_body = models.JSONField('тело ответа')
+    order = models.ForeignKey(Order, verbose_name='Заказ', related_name='idempotency_keys', null=True, on_delete=models.SET_NULL)
+    created_at = models.DateTimeField('Дата создания', auto_now_add=True, db_index=True)
+
+    class Meta:
+        verbose_name = 'Ключ идемпотентности заказа'
+        verbose_name_plural = 'Ключи идемпотентности заказов'
+
+    def __str__(self):
+        return self.key
+
+
+class BannerQuerySet(models.QuerySet):
+    def active(self, at=None):
+        at = at or timezone.now()
+        return (
+            self
+            .filter(is_active=True)
+            .filter(Q(starts_at__isnull=True) | Q(starts_at__lte=at))
+            .filter(Q(ends_at__isnull=True) | Q(ends_at__gt=at))
+        )
+
+    def get_next_change(self, after=None):
+        """Closest moment after the given one when some banner is shown or hidden."""
+        after = after or timezone.now()
+        changes = [
+            *self.filter(is_active=True, starts_at__gt=after).values_list('starts_at', flat=True),
+            *self.filter(is_active=True, ends_at__gt=after).values_list('ends_at', flat=True),
+        ]
+        return min(changes, default=None)
+
+
+class Banner(models.Model):
+    title = models.CharField('заголовок', max_length=50)
+    text = models.CharField('текст', max_length=200, blank=True)
+    image = models.ImageField('картинка', upload_to='banners')
+    position = models.PositiveIntegerField('порядок', default=0, db_index=True)
+    is_active = models.BooleanField('показывать', default=True, db_index=True)
+    starts_at = models.DateTimeField('показывать с', null=True, blank=True)
+    ends_at = models.DateTimeField('показывать до', null=True, blank=True)
+
+    objects = BannerQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'баннер'
+        verbose_name_plural = 'баннеры'
+        ordering = ['position', 'id']
+
+    def __str__(self):
+        return self.title
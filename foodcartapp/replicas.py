@@ -0,0 +1,91 @@
+"""Reads from database replicas.
+
+Views wrapped in read_only_view send their queries to one of REPLICA_DATABASES,
+the rest of the site reads and writes the primary. Replicas lag behind, so a
+client that has just sent a form or an order gets a cookie pinning it to the
+primary for REPLICA_MAX_LAG seconds and sees its own changes right away.
+"""
+import contextlib
+import contextvars
+import functools
+import random
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+
+PIN_COOKIE_NAME = 'pin_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+_replica_alias = contextvars.ContextVar('replica_alias', default=None)
+
+
+def get_read_alias():
+    """Database the current view reads from, None outside read-only views."""
+    return _replica_alias.get()
+
+
+def get_cache_timeout(timeout):
+    """Shorten the cache timeout of data read from a replica, which may miss the latest changes."""
+    if get_read_alias() is None:
+        return timeout
+    if timeout is None:
+        return settings.REPLICA_MAX_LAG
+    return min(timeout, settings.REPLICA_MAX_LAG)
+
+
+@contextlib.contextmanager
+def use_primary():
+    """Read from the primary inside a read-only view, for code that writes depending on what it reads."""
+    token = _replica_alias.set(None)
+    try:
+        yield
+    finally:
+        _replica_alias.reset(token)
+
+
+def read_only_view(view):
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not settings.REPLICA_DATABASES or PIN_COOKIE_NAME in request.COOKIES:
+            return view(request, *args, **kwargs)
+
+        # One replica for the whole request, so it sees a single consistent snapshot
+        token = _replica_alias.set(random.choice(settings.REPLICA_DATABASES))
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _replica_alias.reset(token)
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return get_read_alias()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get the schema from the primary by replication
+        return db not in settings.REPLICA_DATABASES
+
+
+class PrimaryPinMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if settings.REPLICA_DATABASES and request.method not in SAFE_METHODS:
+            response.set_cookie(
+                PIN_COOKIE_NAME,
+                '1',
+                max_age=settings.REPLICA_MAX_LAG,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
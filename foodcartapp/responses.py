@@ -0,0 +1,75 @@
+import gzip
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+
+from monitoring import metrics
+
+from .replicas import get_cache_timeout
+
+
+def encode_payload(data):
+    """Encode data to JSON bytes once, together with a gzip variant and a strong ETag."""
+    body = json.dumps(data, ensure_ascii=False, cls=DjangoJSONEncoder).encode()
+    digest = hashlib.sha256(body).hexdigest()[:32]
+    return {
+        'body': body,
+        'gzip_body': gzip.compress(body, compresslevel=9),
+        'etag': f'"{digest}"',
+        'gzip_etag': f'"{digest}-gzip"',
+    }
+
+
+def get_cached_payload(cache_name, cache_key, get_data, timeout):
+    """Get the encoded payload from cache, timeout may be a callable evaluated on a cache miss."""
+    payload = cache.get(cache_key)
+    metrics.record_cache_access(cache_name, hit=payload is not None)
+    if payload is None:
+        payload = encode_payload(get_data())
+        cache.set(cache_key, payload, get_cache_timeout(timeout() if callable(timeout) else timeout))
+    return payload
+
+
+def get_quality(params):
+    """The q value of an Accept-Encoding item, 1 if it is missing or malformed."""
+    for param in params.split(';'):
+        name, _, value = param.partition('=')
+        if name.strip().lower() == 'q':
+            try:
+                return float(value)
+            except ValueError:
+                return 1
+    return 1
+
+
+def accepts_gzip(request):
+    for encoding in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, _, params = encoding.partition(';')
+        if coding.strip().lower() == 'gzip':
+            return get_quality(params) > 0
+    return False
+
+
+def make_payload_response(request, payload, cache_control='no-cache'):
+    """Answer with the pre-encoded payload, or with 304 if the client already has it."""
+    use_gzip = accepts_gzip(request)
+    etag = payload['gzip_etag'] if use_gzip else payload['etag']
+
+    if_none_match = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    if '*' in if_none_match or {payload['etag'], payload['gzip_etag']} & set(if_none_match):
+        response = HttpResponseNotModified()
+    elif use_gzip:
+        response = HttpResponse(payload['gzip_body'], content_type='application/json')
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = HttpResponse(payload['body'], content_type='application/json')
+
+    response['ETag'] = etag
+    response['Cache-Control'] = cache_control
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
@@ -0,0 +1,160 @@
+"""Full-text search over product names, categories and descriptions.
+
+On SQLite the index is an FTS5 table with the unicode61 tokenizer, which folds
+the case of Cyrillic letters unlike LIKE. On PostgreSQL it is a table of
+weighted tsvectors under a GIN index. The table is created by a migration
+rather than a model and is kept up to date by signals. Every word of a query
+matches as a prefix, so results appear while the customer is still typing.
+"""
+import re
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Product
+
+
+SEARCH_TABLE = 'foodcartapp_productsearch'
+SUPPORTED_VENDORS = ('sqlite', 'postgresql')
+MAX_SEARCH_TERMS = 8
+INDEX_BATCH_SIZE = 500
+
+WORD_PATTERN = re.compile(r'\w+')
+
+
+def get_search_terms(text):
+    """Lowercased words of the query, ё is searched as е."""
+    return WORD_PATTERN.findall(text.lower().replace('ё', 'е'))[:MAX_SEARCH_TERMS]
+
+
+def _normalized(column):
+    return f"REPLACE(REPLACE(COALESCE({column}, ''), 'ё', 'е'), 'Ё', 'Е')"
+
+
+def _get_index_sql(vendor, condition):
+    source = (
+        'FROM foodcartapp_product product '
+        'LEFT JOIN foodcartapp_productcategory category ON category.id = product.category_id'
+    )
+    name, category, description = (
+        _normalized('product.name'),
+        _normalized('category.name'),
+        _normalized('product.description'),
+    )
+    if vendor == 'sqlite':
+        return (
+            f'INSERT OR REPLACE INTO {SEARCH_TABLE} (rowid, name, category, description) '
+            f'SELECT product.id, {name}, {category}, {description} {source} WHERE {condition}'
+        )
+    return (
+        f'INSERT INTO {SEARCH_TABLE} (product_id, document) '
+        f"SELECT product.id, setweight(to_tsvector('simple', {name}), 'A') "
+        f"|| setweight(to_tsvector('simple', {category}), 'B') "
+        f"|| setweight(to_tsvector('simple', {description}), 'C') {source} WHERE {condition} "
+        f'ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document'
+    )
+
+
+def _get_match_sql(vendor, products_sql=None):
+    """SQL selecting ids of matching products, best matches first, and a function making its parameters.
+
+    products_sql is a subquery of product ids to search among, its parameters go after the terms.
+    """
+    if vendor == 'sqlite':
+        products_condition = f'AND rowid IN ({products_sql}) ' if products_sql else ''
+        # Matches in the name weigh more than in the category, and those more than in the description
+        sql = (
+            f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s {products_condition}'
+            f'ORDER BY bm25({SEARCH_TABLE}, 10.0, 5.0, 1.0), rowid'
+        )
+        return sql, lambda terms, products_params=(): [' '.join(f'"{term}"*' for term in terms), *products_params]
+
+    products_condition = f'AND product_id IN ({products_sql}) ' if products_sql else ''
+    sql = (
+        f"SELECT product_id FROM {SEARCH_TABLE} WHERE document @@ to_tsquery('simple', %s) {products_condition}"
+        f"ORDER BY ts_rank(document, to_tsquery('simple', %s)) DESC, product_id"
+    )
+
+    def get_params(terms, products_params=()):
+        query = ' & '.join(f"'{term}':*" for term in terms)
+        return [query, *products_params, query]
+    return sql, get_params
+
+
+def _batches(product_ids):
+    product_ids = list(product_ids)
+    for start in range(0, len(product_ids), INDEX_BATCH_SIZE):
+        batch = product_ids[start:start + INDEX_BATCH_SIZE]
+        yield ', '.join(['%s'] * len(batch)), batch
+
+
+def update_search_index(product_ids=None, using=DEFAULT_DB_ALIAS):
+    """Index the products again, all of them if no ids are given."""
+    connection = connections[using]
+    if connection.vendor not in SUPPORTED_VENDORS:
+        return
+
+    with connection.cursor() as cursor:
+        if product_ids is None:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+            cursor.execute(_get_index_sql(connection.vendor, '1 = 1'))
+            return
+        for placeholders, batch in _batches(product_ids):
+            cursor.execute(_get_index_sql(connection.vendor, f'product.id IN ({placeholders})'), batch)
+
+
+def remove_from_search_index(product_ids, using=DEFAULT_DB_ALIAS):
+    connection = connections[using]
+    if connection.vendor not in SUPPORTED_VENDORS:
+        return
+    id_column = 'rowid' if connection.vendor == 'sqlite' else 'product_id'
+    with connection.cursor() as cursor:
+        for placeholders, batch in _batches(product_ids):
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE {id_column} IN ({placeholders})', batch)
+
+
+def search_product_ids(text, queryset=None, limit=None, using=DEFAULT_DB_ALIAS):
+    """Ids of products matching every word of the text, best matches first.
+
+    The search runs among the products of the queryset, if given, and stops
+    at limit ids, so short prefixes do not read the whole catalog.
+    """
+    terms = get_search_terms(text)
+    if not terms:
+        return []
+
+    connection = connections[using]
+    if connection.vendor not in SUPPORTED_VENDORS:
+        products = (Product.objects.all() if queryset is None else queryset).using(using)
+        return list(filter_products(products, text).order_by('id').values_list('id', flat=True)[:limit])
+
+    products_sql, products_params = None, ()
+    if queryset is not None:
+        products_sql, products_params = queryset.order_by().values('pk').query.get_compiler(using).as_sql()
+    sql, get_params = _get_match_sql(connection.vendor, products_sql)
+    params = get_params(terms, products_params)
+    if limit is not None:
+        sql += ' LIMIT %s'
+        params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [product_id for product_id, in cursor.fetchall()]
+
+
+def filter_products(queryset, text):
+    """Narrow the queryset down to products matching every word of the text."""
+    terms = get_search_terms(text)
+    if not terms:
+        return queryset
+
+    vendor = connections[queryset.db].vendor
+    if vendor not in SUPPORTED_VENDORS:
+        for term in terms:
+            queryset = queryset.filter(
+                Q(name__icontains=term) | Q(category__name__icontains=term) | Q(description__icontains=term)
+            )
+        return queryset
+
+    sql, get_params = _get_match_sql(vendor)
+    return queryset.filter(pk__in=RawSQL(sql, get_params(terms)))
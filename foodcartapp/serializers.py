@@ -1,13 +1,22 @@
 from rest_framework import serializers
 
-from .models import Order, ProductQuantity
+from .models import Order, Product, ProductQuantity
 
 
-class ProductQuantitySerializer(serializers.ModelSerializer):
-    class Meta:
-        model = ProductQuantity
-        fields = ('quantity', 'product',)
-        read_only_fields = ('order',)
+MAX_PRODUCT_QUANTITY = 1000
+# Largest primary key of the AutoField column; bigger numbers overflow the database lookup
+MAX_PRODUCT_ID = 2 ** 31 - 1
+
+
+def get_max_value(model, field_name):
+    """Smallest amount that does not fit the decimal column."""
+    field = model._meta.get_field(field_name)
+    return 10 ** (field.max_digits - field.decimal_places)
+
+
+class ProductQuantitySerializer(serializers.Serializer):
+    product = serializers.IntegerField(min_value=1, max_value=MAX_PRODUCT_ID)
+    quantity = serializers.IntegerField(min_value=1, max_value=MAX_PRODUCT_QUANTITY)
 
 
 class OrderSerializer(serializers.ModelSerializer):
@@ -16,3 +25,30 @@ class OrderSerializer(serializers.ModelSerializer):
     class Meta:
         model = Order
         fields = ('products', 'address', 'firstname', 'lastname', 'phonenumber',)
+
+    def validate_products(self, products):
+        found_products = Product.objects.only('price').in_bulk({item['product'] for item in products})
+
+        does_not_exist = serializers.PrimaryKeyRelatedField.default_error_messages['does_not_exist']
+        errors = [
+            {} if item['product'] in found_products else {'product': [does_not_exist.format(pk_value=item['product'])]}
+            for item in products
+        ]
+        if any(errors):
+            raise serializers.ValidationError(errors)
+
+        max_line_total = get_max_value(ProductQuantity, 'line_total')
+        line_totals = [found_products[item['product']].price * item['quantity'] for item in products]
+        errors = [
+            {'quantity': ['Слишком большая стоимость позиции.']} if line_total >= max_line_total else {}
+            for line_total in line_totals
+        ]
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        if sum(line_totals) >= get_max_value(Order, 'total_price'):
+            raise serializers.ValidationError('Слишком большая стоимость заказа.')
+
+        return [
+            {'product': found_products[item['product']], 'quantity': item['quantity']}
+            for item in products
+        ]
@@ -0,0 +1,102 @@
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import Banner, Order, OrderEvent, Product, ProductCategory, Restaurant, RestaurantMenuItem
+from .search import remove_from_search_index, update_search_index
+from .thumbnails import update_image_variants
+from .versions import bump_version_on_commit
+
+
+@receiver(post_save, sender=RestaurantMenuItem)
+@receiver(post_delete, sender=RestaurantMenuItem)
+def invalidate_menu(sender, **kwargs):
+    bump_version_on_commit('menu')
+    bump_version_on_commit('catalog')
+
+
+@receiver(post_save, sender=Restaurant)
+@receiver(post_delete, sender=Restaurant)
+def invalidate_restaurants(sender, **kwargs):
+    bump_version_on_commit('menu')
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductCategory)
+@receiver(post_delete, sender=ProductCategory)
+def invalidate_catalog(sender, **kwargs):
+    bump_version_on_commit('catalog')
+
+
+@receiver(post_save, sender=Product)
+def make_thumbnails(sender, instance, raw=False, **kwargs):
+    if not raw:
+        update_image_variants(instance)
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, using, raw=False, **kwargs):
+    if not raw:
+        update_search_index([instance.pk], using=using)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, using, **kwargs):
+    remove_from_search_index([instance.pk], using=using)
+
+
+@receiver(post_save, sender=ProductCategory)
+def index_category_products(sender, instance, using, raw=False, **kwargs):
+    if not raw:
+        update_search_index(instance.products.using(using).values_list('id', flat=True), using=using)
+
+
+@receiver(post_delete, sender=ProductCategory)
+def index_uncategorized_products(sender, using, **kwargs):
+    products = Product.objects.using(using).filter(category__isnull=True)
+    update_search_index(products.values_list('id', flat=True), using=using)
+
+
+@receiver(post_save, sender=Banner)
+@receiver(post_delete, sender=Banner)
+def invalidate_banners(sender, **kwargs):
+    bump_version_on_commit('banners')
+
+
+@receiver(pre_save, sender=Order)
+def start_assigned_order(sender, instance, **kwargs):
+    if instance.selected_restaurant_id and instance.status == Order.OrderStatus.UNPROCESSED:
+        instance.status = Order.OrderStatus.IN_PROGRESS
+
+
+TRACKED_ORDER_FIELDS = {
+    'status': OrderEvent.Kind.STATUS_CHANGED,
+    'selected_restaurant_id': OrderEvent.Kind.RESTAURANT_ASSIGNED,
+}
+
+
+def get_tracked_order_state(order):
+    # Deferred fields are skipped, reading them would cost a query per order
+    return {field: order.__dict__[field] for field in TRACKED_ORDER_FIELDS if field in order.__dict__}
+
+
+@receiver(post_init, sender=Order)
+def remember_order_state(sender, instance, **kwargs):
+    instance._tracked_state = get_tracked_order_state(instance)
+
+
+@receiver(post_save, sender=Order)
+def record_order_events(sender, instance, created, using, raw=False, **kwargs):
+    if raw:
+        return
+
+    if created:
+        kinds = [OrderEvent.Kind.CREATED]
+    else:
+        kinds = [
+            kind for field, kind in TRACKED_ORDER_FIELDS.items()
+            if field in instance._tracked_state and instance._tracked_state[field] != getattr(instance, field)
+        ]
+    if kinds:
+        OrderEvent.objects.using(using).bulk_create([OrderEvent.build(instance, kind) for kind in kinds])
+    instance._tracked_state = get_tracked_order_state(instance)
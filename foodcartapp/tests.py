@@ -0,0 +1,807 @@
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+from unittest import mock
+
+from PIL import Image
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import QuerySet
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from .intake import drain, insert_orders
+from .models import Banner, Order, OrderEvent, OrderIdempotencyKey, Product, ProductCategory, ProductQuantity, Restaurant, RestaurantMenuItem
+from .search import search_product_ids
+from .serializers import MAX_PRODUCT_QUANTITY
+from .thumbnails import THUMBNAIL_WIDTHS
+
+
+class TempMediaMixin:
+    """Save uploaded files to a temporary MEDIA_ROOT removed after the tests."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_override = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.media_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+
+class ManagerLoginMixin:
+    def login_manager(self):
+        manager = get_user_model().objects.create_user('manager', is_staff=True, is_superuser=True)
+        self.client.force_login(manager)
+
+
+class QueryBudgetTestCase(TempMediaMixin, ManagerLoginMixin, TestCase):
+    """Check that a view keeps the same number of queries as data grows.
+
+    Every check runs twice: on a small dataset and after generate_dataset adds
+    several times more restaurants, products and orders. A query count that
+    depends on the amount of data fails on the second run. Response time is
+    checked only if QUERY_BUDGET_LATENCY sets the budget in seconds, since it
+    depends on the machine running the tests.
+    """
+
+    DATA_SIZES = [
+        {'restaurants': 2, 'products': 5, 'orders': 5},
+        {'restaurants': 8, 'products': 40, 'orders': 60},
+    ]
+    LATENCY_BUDGET = float(os.environ.get('QUERY_BUDGET_LATENCY', 0))
+
+    def assertBudget(self, send_request, num_queries, prepare=None, latency_budget=None):
+        """Send the request at every data size.
+
+        prepare runs before the measurement, its result is passed to send_request.
+        """
+        latency_budget = latency_budget or self.LATENCY_BUDGET
+        for seed, data_size in enumerate(self.DATA_SIZES):
+            call_command('generate_dataset', open_orders=0.5, seed=seed, stdout=io.StringIO(), **data_size)
+            prepared = prepare() if prepare else None
+            cache.clear()
+            ContentType.objects.clear_cache()
+            with self.subTest(**data_size):
+                with self.assertNumQueries(num_queries):
+                    started_at = time.perf_counter()
+                    response = send_request(prepared)
+                    elapsed = time.perf_counter() - started_at
+                self.assertLess(response.status_code, 400)
+                if latency_budget:
+                    self.assertLess(elapsed, latency_budget)
+
+
+class ApiBudgetTest(QueryBudgetTestCase):
+    def test_product_list(self):
+        self.assertBudget(lambda _: self.client.get('/api/products/'), num_queries=1)
+
+    def test_product_search(self):
+        self.assertBudget(lambda _: self.client.get('/api/products/search/', {'q': 'товар'}), num_queries=2)
+
+    def test_register_order(self):
+        def get_payload():
+            products = Product.objects.filter(menu_items__availability=True).distinct()[:3]
+            return {
+                'products': [{'product': product.id, 'quantity': 2} for product in products],
+                'firstname': 'Иван',
+                'lastname': 'Иванов',
+                'phonenumber': '+79001234567',
+                'address': 'Москва, ул. Арбат, д. 1',
+            }
+
+        # Saving the order also records its creation event
+        self.assertBudget(
+            lambda payload: self.client.post('/api/order/', payload, content_type='application/json'),
+            num_queries=6,
+            prepare=get_payload,
+        )
+
+
+class PayloadResponseTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def get_products(self, **headers):
+        return self.client.get('/api/products/', **headers)
+
+    def test_etag_is_answered_with_not_modified(self):
+        response = self.get_products()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [])
+
+        response = self.get_products(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_gzip_is_negotiated(self):
+        response = self.get_products(HTTP_ACCEPT_ENCODING='br, gzip;q=0.5')
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), b'[]')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        not_modified = self.get_products(HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_identity_is_sent_unless_gzip_is_accepted(self):
+        for accept_encoding in ['', 'identity', 'gzip;q=0', 'GZIP; q=0.0, deflate']:
+            with self.subTest(accept_encoding=accept_encoding):
+                response = self.get_products(HTTP_ACCEPT_ENCODING=accept_encoding)
+
+                self.assertFalse(response.has_header('Content-Encoding'))
+                self.assertEqual(response.content, b'[]')
+                self.assertNotIn('-gzip', response['ETag'])
+
+
+class BannersApiTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        Banner.objects.all().delete()
+        self.burger = Banner.objects.create(title='Бургер', text='Вкусно', image='banners/burger.jpg', position=1)
+        self.spices = Banner.objects.create(title='Специи', image='banners/food.jpg', position=0)
+        Banner.objects.create(title='Скрытый', image='banners/tasty.jpg', is_active=False)
+        Banner.objects.create(title='Прошедший', image='banners/tasty.jpg', ends_at=timezone.now())
+
+    def test_active_banners_are_listed_in_order(self):
+        response = self.client.get('/api/banners/')
+
+        self.assertEqual(response.json(), [
+            {'title': 'Специи', 'src': '/media/banners/food.jpg', 'text': ''},
+            {'title': 'Бургер', 'src': '/media/banners/burger.jpg', 'text': 'Вкусно'},
+        ])
+        self.assertEqual(response['Cache-Control'], 'public, max-age=60')
+
+    def test_list_is_cached_until_a_banner_changes(self):
+        self.client.get('/api/banners/')
+        with self.assertNumQueries(0):
+            self.client.get('/api/banners/')
+
+        self.burger.title = 'Чизбургер'
+        self.burger.save()
+
+        titles = [banner['title'] for banner in self.client.get('/api/banners/').json()]
+        self.assertEqual(titles, ['Специи', 'Чизбургер'])
+
+    def test_migrations_copy_banner_images_outside_site_media(self):
+        self.assertNotEqual(os.path.realpath(settings.MEDIA_ROOT), os.path.join(settings.BASE_DIR, 'media'))
+        self.assertTrue(default_storage.exists('banners/burger.jpg'))
+
+
+@contextmanager
+def miss_idempotency_key_once():
+    """Make the first lookup of a key miss, as if a concurrent request saved it right after the check."""
+    first = QuerySet.first
+    missed_lookups = []
+
+    def miss_key_once(queryset):
+        if queryset.model is OrderIdempotencyKey and not missed_lookups:
+            missed_lookups.append(queryset)
+            return None
+        return first(queryset)
+
+    with mock.patch.object(QuerySet, 'first', miss_key_once):
+        yield missed_lookups
+
+
+class OrderPayloadMixin:
+    def setUp(self):
+        # bulk_create skips the thumbnail signals that need the image files
+        Product.objects.bulk_create([
+            Product(name='Бургер', price=100, image='burger.png'),
+            Product(name='Картошка', price=50, image='fries.png'),
+        ])
+        self.burger, self.fries = Product.objects.order_by('-price')
+
+    def get_payload(self, quantity=2):
+        return {
+            'products': [
+                {'product': self.burger.id, 'quantity': quantity},
+                {'product': self.fries.id, 'quantity': 1},
+            ],
+            'firstname': 'Иван',
+            'lastname': 'Иванов',
+            'phonenumber': '+79001234567',
+            'address': 'Москва, ул. Арбат, д. 1',
+        }
+
+    def post_order(self, payload, **headers):
+        return self.client.post('/api/order/', payload, content_type='application/json', **headers)
+
+
+class RegisterOrderTest(OrderPayloadMixin, TestCase):
+
+    def test_order_is_saved_with_prices(self):
+        response = self.post_order(self.get_payload())
+
+        self.assertEqual(response.status_code, 200)
+        order = Order.objects.get()
+        self.assertEqual(order.total_price, 250)
+        self.assertEqual(
+            sorted(order.ordered_items.values_list('quantity', 'unit_price', 'line_total')),
+            [(1, 50, 50), (2, 100, 200)],
+        )
+
+    def test_quantity_is_limited(self):
+        response = self.post_order(self.get_payload(quantity=MAX_PRODUCT_QUANTITY + 1))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('quantity', response.json()['products'][0])
+        self.assertFalse(Order.objects.exists())
+
+    def test_product_id_out_of_range_is_rejected(self):
+        for product_id in [0, 2 ** 70]:
+            payload = self.get_payload()
+            payload['products'][0]['product'] = product_id
+
+            response = self.post_order(payload)
+
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('product', response.json()['products'][0])
+        self.assertFalse(Order.objects.exists())
+
+    def test_order_too_expensive_to_store_is_rejected(self):
+        Product.objects.filter(pk=self.burger.pk).update(price=Decimal('999999.99'))
+
+        line_response = self.post_order(self.get_payload(quantity=MAX_PRODUCT_QUANTITY))
+        # Every line fits its column, but the order total does not
+        order_response = self.post_order(self.get_payload(quantity=100))
+
+        self.assertEqual(line_response.status_code, 400)
+        self.assertEqual(line_response.json()['products'][0], {'quantity': ['Слишком большая стоимость позиции.']})
+        self.assertEqual(order_response.status_code, 400)
+        self.assertEqual(order_response.json(), {'products': ['Слишком большая стоимость заказа.']})
+        self.assertFalse(Order.objects.exists())
+
+    def test_retry_with_idempotency_key_is_replayed(self):
+        response = self.post_order(self.get_payload(), HTTP_IDEMPOTENCY_KEY='order-1')
+        replayed_response = self.post_order(self.get_payload(), HTTP_IDEMPOTENCY_KEY='order-1')
+
+        self.assertEqual(replayed_response.status_code, 200)
+        self.assertEqual(replayed_response.json(), response.json())
+        self.assertEqual(replayed_response['Idempotent-Replayed'], 'true')
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(OrderIdempotencyKey.objects.get().order, Order.objects.get())
+
+    def test_other_order_with_same_key_is_rejected(self):
+        self.post_order(self.get_payload(), HTTP_IDEMPOTENCY_KEY='order-1')
+
+        response = self.post_order(self.get_payload(quantity=3), HTTP_IDEMPOTENCY_KEY='order-1')
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_bad_idempotency_key(self):
+        response = self.post_order(self.get_payload(), HTTP_IDEMPOTENCY_KEY='x' * 256)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+    def test_concurrent_duplicate_is_replayed(self):
+        response = self.post_order(self.get_payload(), HTTP_IDEMPOTENCY_KEY='order-1')
+
+        with miss_idempotency_key_once() as missed_lookups:
+            replayed_response = self.post_order(self.get_payload(), HTTP_IDEMPOTENCY_KEY='order-1')
+
+        self.assertEqual(len(missed_lookups), 1)
+        self.assertEqual(replayed_response.status_code, 200)
+        self.assertEqual(replayed_response.json(), response.json())
+        self.assertEqual(replayed_response['Idempotent-Replayed'], 'true')
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(ProductQuantity.objects.count(), 2)
+
+    def test_buffered_order_is_replayed(self):
+        with tempfile.TemporaryDirectory() as intake_dir:
+            with override_settings(ORDER_INTAKE_MODE='buffered', ORDER_INTAKE_DIR=intake_dir):
+                response = self.post_order(self.get_payload(), HTTP_IDEMPOTENCY_KEY='order-1')
+                replayed_response = self.post_order(self.get_payload(), HTTP_IDEMPOTENCY_KEY='order-1')
+                conflicting_response = self.post_order(self.get_payload(quantity=3), HTTP_IDEMPOTENCY_KEY='order-1')
+
+            buffered_records = [
+                line
+                for filename in os.listdir(intake_dir)
+                for line in open(os.path.join(intake_dir, filename), encoding='utf-8')
+            ]
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(replayed_response.status_code, 202)
+        self.assertEqual(replayed_response.json(), response.json())
+        self.assertEqual(replayed_response['Idempotent-Replayed'], 'true')
+        self.assertEqual(conflicting_response.status_code, 422)
+        self.assertEqual(len(buffered_records), 1)
+        self.assertFalse(Order.objects.exists())
+
+
+class OrderTotalsTest(OrderPayloadMixin, ManagerLoginMixin, TestCase):
+    def create_order(self, *items):
+        order = Order.objects.create(lastname='Иванов', phonenumber='+79001234567', address='Москва', total_price=999)
+        for product, quantity in items:
+            ProductQuantity.objects.create(order=order, product=product, quantity=quantity)
+        return order
+
+    def test_totals_are_recalculated_from_lines(self):
+        order = self.create_order((self.burger, 2), (self.fries, 3))
+        empty_order = self.create_order()
+
+        self.assertEqual(Order.objects.filter(pk__in=[order.pk, empty_order.pk]).update_total_prices(), 2)
+
+        self.assertEqual(Order.objects.get(pk=order.pk).total_price, 350)
+        self.assertEqual(Order.objects.get(pk=empty_order.pk).total_price, 0)
+
+    def test_backfill_command(self):
+        orders = [self.create_order((self.burger, quantity)) for quantity in range(1, 4)]
+        updated_at = dict(Order.objects.values_list('pk', 'updated_at'))
+
+        output = io.StringIO()
+        call_command('backfill_order_totals', batch_size=2, stdout=output)
+
+        self.assertEqual(output.getvalue().strip(), 'Updated 3 orders')
+        self.assertEqual(
+            list(Order.objects.filter(pk__in=[order.pk for order in orders]).order_by('pk').values_list('total_price', flat=True)),
+            [100, 200, 300],
+        )
+        self.assertEqual(dict(Order.objects.values_list('pk', 'updated_at')), updated_at)
+
+    def test_admin_recalculates_total_after_lines_change(self):
+        order = self.create_order((self.burger, 2), (self.fries, 1))
+        burger_line, fries_line = order.ordered_items.order_by('pk')
+        self.login_manager()
+
+        response = self.client.post(f'/admin/foodcartapp/order/{order.pk}/change/', {
+            'address': order.address,
+            'lastname': order.lastname,
+            'phonenumber': str(order.phonenumber),
+            'status': order.status,
+            'payment_method': order.payment_method,
+            'ordered_items-TOTAL_FORMS': 2,
+            'ordered_items-INITIAL_FORMS': 2,
+            'ordered_items-0-id': burger_line.pk,
+            'ordered_items-0-order': order.pk,
+            'ordered_items-0-product': self.burger.pk,
+            'ordered_items-0-quantity': 5,
+            'ordered_items-0-unit_price': '90.00',
+            'ordered_items-1-id': fries_line.pk,
+            'ordered_items-1-order': order.pk,
+            'ordered_items-1-product': self.fries.pk,
+            'ordered_items-1-quantity': 1,
+            'ordered_items-1-unit_price': '50.00',
+            'ordered_items-1-DELETE': 'on',
+        })
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Order.objects.get(pk=order.pk).total_price, 450)
+
+
+class UnitPriceMigrationTest(TransactionTestCase):
+    migrate_from = [('foodcartapp', '0067_order_total_price')]
+    migrate_to = [('foodcartapp', '0068_productquantity_unit_price')]
+
+    def setUp(self):
+        executor = MigrationExecutor(connection)
+        self.addCleanup(self.migrate_to_latest)
+        executor.migrate(self.migrate_from)
+        old_apps = executor.loader.project_state(self.migrate_from).apps
+
+        product = old_apps.get_model('foodcartapp', 'Product').objects.create(name='Бургер', price=Decimal('33.50'), image='burger.png')
+        order = old_apps.get_model('foodcartapp', 'Order').objects.create(lastname='Иванов', phonenumber='+79001234567', address='Москва')
+        ProductQuantity = old_apps.get_model('foodcartapp', 'ProductQuantity')
+        self.line_ids = [
+            ProductQuantity.objects.create(order=order, product=product, quantity=quantity, price=price).pk
+            for quantity, price in [(2, Decimal('67.00')), (3, Decimal('100.00')), (0, Decimal('10.00'))]
+        ]
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.migrate_to)
+        self.apps = executor.loader.project_state(self.migrate_to).apps
+
+    def migrate_to_latest(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_unit_prices_keep_cents(self):
+        ProductQuantity = self.apps.get_model('foodcartapp', 'ProductQuantity')
+
+        unit_prices = ProductQuantity.objects.in_bulk(self.line_ids)
+        self.assertEqual(
+            [(unit_prices[line_id].unit_price, unit_prices[line_id].line_total) for line_id in self.line_ids],
+            [(Decimal('33.50'), Decimal('67.00')), (Decimal('33.33'), Decimal('100.00')), (Decimal('10.00'), Decimal('10.00'))],
+        )
+
+
+class OrderIntakeTest(OrderPayloadMixin, TransactionTestCase):
+    """Runs in real transactions, so SQLite checks foreign keys on commit as in production."""
+
+    def setUp(self):
+        super().setUp()
+        self.intake_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.intake_dir, ignore_errors=True)
+        intake_settings = override_settings(ORDER_INTAKE_MODE='buffered', ORDER_INTAKE_DIR=self.intake_dir)
+        intake_settings.enable()
+        self.addCleanup(intake_settings.disable)
+
+    def drain_closed_segments(self):
+        # Segments are drained only when nobody writes to them anymore
+        with mock.patch('foodcartapp.intake.time.time', return_value=time.time() + 60):
+            return drain(batch_size=10)
+
+    def get_segment_paths(self):
+        return [
+            os.path.join(self.intake_dir, filename)
+            for filename in os.listdir(self.intake_dir)
+            if filename.endswith('.jsonl')
+        ]
+
+    def test_accepted_order_is_inserted_by_drain(self):
+        response = self.post_order(self.get_payload())
+
+        self.assertEqual(response.status_code, 202)
+        self.assertFalse(Order.objects.exists())
+
+        self.assertEqual(self.drain_closed_segments(), 1)
+        order = Order.objects.get()
+        self.assertEqual(order.total_price, 250)
+        self.assertEqual(order.ordered_items.count(), 2)
+        self.assertEqual(self.get_segment_paths(), [])
+
+    def test_drain_retried_after_crash_inserts_orders_once(self):
+        self.post_order(self.get_payload())
+        segment_path, = self.get_segment_paths()
+        with open(segment_path, 'rb') as segment:
+            content = segment.read()
+        self.drain_closed_segments()
+
+        # The worker died after the insert, before it deleted the segment
+        with open(segment_path, 'wb') as segment:
+            segment.write(content)
+
+        self.assertEqual(self.drain_closed_segments(), 0)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(self.get_segment_paths(), [])
+
+    def test_order_that_fails_is_moved_aside(self):
+        self.post_order(self.get_payload())
+        burger_only_payload = self.get_payload()
+        burger_only_payload['products'] = burger_only_payload['products'][:1]
+        self.post_order(burger_only_payload)
+        self.fries.delete()
+
+        with self.assertLogs('foodcartapp.intake', 'ERROR'):
+            self.assertEqual(self.drain_closed_segments(), 1)
+
+        self.assertEqual(Order.objects.get().total_price, 200)
+        self.assertEqual(self.get_segment_paths(), [])
+        failed_dir = os.path.join(self.intake_dir, 'failed')
+        failed_filename, = os.listdir(failed_dir)
+        with open(os.path.join(failed_dir, failed_filename), encoding='utf-8') as failed_segment:
+            failed_record, = [json.loads(line) for line in failed_segment]
+        self.assertEqual(len(failed_record['products']), 2)
+
+        # Failed orders do not come back on the next pass
+        self.assertEqual(self.drain_closed_segments(), 0)
+
+    def test_order_rejected_under_a_claimed_key_is_not_buffered(self):
+        response = self.post_order(self.get_payload(), HTTP_IDEMPOTENCY_KEY='order-1')
+        with miss_idempotency_key_once():
+            conflicting_response = self.post_order(self.get_payload(quantity=5), HTTP_IDEMPOTENCY_KEY='order-1')
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(conflicting_response.status_code, 422)
+        self.assertEqual(self.drain_closed_segments(), 1)
+        self.assertEqual(Order.objects.get().total_price, 250)
+
+    def test_first_record_of_a_retried_order_is_inserted(self):
+        record = {
+            'intake_id': '0b5c4c36-64b5-4ab3-a3a4-8e1d9f3b7c21',
+            'created_at': '2026-10-18T10:00:00+00:00',
+            'firstname': 'Иван',
+            'lastname': 'Иванов',
+            'phonenumber': '+79001234567',
+            'address': 'Москва',
+            'products': [],
+        }
+
+        insert_orders([record, {**record, 'address': 'Тверь'}])
+
+        self.assertEqual(Order.objects.get().address, 'Москва')
+
+    def test_unknown_files_are_left_alone(self):
+        for filename in ['notes.jsonl', 'backup-000000000001.jsonl']:
+            with open(os.path.join(self.intake_dir, filename), 'w') as stray_file:
+                stray_file.write('{}\n')
+
+        self.assertEqual(self.drain_closed_segments(), 0)
+        self.assertEqual(len(self.get_segment_paths()), 2)
+
+
+class AdminBudgetTest(QueryBudgetTestCase):
+    def setUp(self):
+        self.login_manager()
+
+    def get_page(self, url):
+        return self.client.get(url)
+
+    def test_order_changelist(self):
+        self.assertBudget(lambda _: self.get_page('/admin/foodcartapp/order/'), num_queries=5)
+
+    def test_product_changelist(self):
+        self.assertBudget(lambda _: self.get_page('/admin/foodcartapp/product/'), num_queries=6)
+
+    def test_product_changelist_search(self):
+        self.assertBudget(lambda _: self.get_page('/admin/foodcartapp/product/?q=ТОВАР'), num_queries=6)
+
+    def test_restaurant_changelist(self):
+        self.assertBudget(lambda _: self.get_page('/admin/foodcartapp/restaurant/'), num_queries=5)
+
+    def test_order_change_page(self):
+        self.assertBudget(
+            self.get_page,
+            num_queries=10,
+            prepare=lambda: f'/admin/foodcartapp/order/{Order.objects.latest("pk").pk}/change/',
+        )
+
+    def test_restaurant_change_page(self):
+        self.assertBudget(
+            self.get_page,
+            num_queries=11,
+            prepare=lambda: f'/admin/foodcartapp/restaurant/{Restaurant.objects.latest("pk").pk}/change/',
+        )
+
+    def test_product_change_page(self):
+        self.assertBudget(
+            self.get_page,
+            num_queries=12,
+            prepare=lambda: f'/admin/foodcartapp/product/{Product.objects.latest("pk").pk}/change/',
+        )
+
+
+class ThumbnailsTest(TempMediaMixin, TestCase):
+    def make_image(self, size):
+        image_file = io.BytesIO()
+        Image.new('RGBA', size, (200, 100, 50, 128)).save(image_file, 'PNG')
+        return SimpleUploadedFile('burger.png', image_file.getvalue(), content_type='image/png')
+
+    def test_thumbnails_are_made_on_upload(self):
+        product = Product.objects.create(name='Бургер', price=100, image=self.make_image((800, 600)))
+
+        product.refresh_from_db()
+        jpeg_names = product.image_variants['formats']['jpeg']
+        self.assertEqual(list(jpeg_names), [str(width) for width in THUMBNAIL_WIDTHS])
+        with default_storage.open(jpeg_names['300']) as thumbnail_file, Image.open(thumbnail_file) as thumbnail:
+            self.assertEqual((thumbnail.format, thumbnail.size), ('JPEG', (300, 225)))
+
+        restaurant = Restaurant.objects.create(name='Star Burger', address='Москва')
+        RestaurantMenuItem.objects.create(restaurant=restaurant, product=product)
+        dumped_product = self.client.get('/api/products/').json()[0]
+        self.assertEqual(dumped_product['thumbnails']['jpeg']['100'], default_storage.url(jpeg_names['100']))
+        self.assertIn(f'{default_storage.url(jpeg_names["600"])} 600w', dumped_product['srcset']['jpeg'])
+
+    def test_small_images_are_not_upscaled(self):
+        product = Product.objects.create(name='Бургер', price=100, image=self.make_image((200, 100)))
+
+        product.refresh_from_db()
+        self.assertEqual(list(product.image_variants['formats']['jpeg']), ['100'])
+
+    def test_same_image_is_not_processed_again(self):
+        product = Product.objects.create(name='Бургер', price=100, image=self.make_image((800, 600)))
+        image_variants = Product.objects.get(pk=product.pk).image_variants
+
+        product.price = 200
+        # The product itself and its row in the search index
+        with self.assertNumQueries(2):
+            product.save()
+
+        self.assertEqual(Product.objects.get(pk=product.pk).image_variants, image_variants)
+
+
+    def test_force_command_encodes_thumbnails_again(self):
+        image = self.make_image((800, 600))
+        products = [Product.objects.create(name=name, price=100, image=image) for name in ['Бургер', 'Чизбургер']]
+        Product.objects.filter(pk=products[1].pk).update(image=Product.objects.get(pk=products[0].pk).image.name)
+        thumbnail_name = Product.objects.get(pk=products[0].pk).image_variants['formats']['jpeg']['300']
+        with default_storage.open(thumbnail_name, 'wb') as thumbnail_file:
+            thumbnail_file.write(b'stale thumbnail')
+
+        output = io.StringIO()
+        call_command('generate_thumbnails', stdout=output)
+        self.assertEqual(output.getvalue().strip(), 'Made thumbnails for 1 products')
+        with default_storage.open(thumbnail_name) as thumbnail_file:
+            self.assertEqual(thumbnail_file.read(), b'stale thumbnail')
+
+        output = io.StringIO()
+        call_command('generate_thumbnails', force=True, stdout=output)
+
+        # The second product shares the image, its thumbnails are already fresh
+        self.assertEqual(output.getvalue().strip(), 'Made thumbnails for 1 products')
+        with default_storage.open(thumbnail_name) as thumbnail_file, Image.open(thumbnail_file) as thumbnail:
+            self.assertEqual((thumbnail.format, thumbnail.size), ('JPEG', (300, 225)))
+        for product in Product.objects.filter(pk__in=[product.pk for product in products]):
+            self.assertEqual(product.image_variants['formats']['jpeg']['300'], thumbnail_name)
+
+
+class ProductSearchTest(TempMediaMixin, ManagerLoginMixin, TestCase):
+    def setUp(self):
+        image = io.BytesIO()
+        Image.new('RGB', (10, 10)).save(image, 'PNG')
+        self.image_name = default_storage.save('search.png', SimpleUploadedFile('search.png', image.getvalue()))
+
+        self.burgers = ProductCategory.objects.create(name='Бургеры')
+        self.drinks = ProductCategory.objects.create(name='Напитки')
+        self.cheeseburger = self.create_product('Чизбургер', self.burgers, 'Котлета и сыр')
+        self.hedgehog = self.create_product('Ёжик в тумане', None, 'Десерт с безе')
+        self.latte = self.create_product('Café latte', self.drinks, 'Кофе с молоком, к бургеру')
+        self.burger = self.create_product('Бургер', self.burgers, '')
+
+        restaurant = Restaurant.objects.create(name='Star Burger', address='Москва')
+        for product in [self.cheeseburger, self.hedgehog, self.latte]:
+            RestaurantMenuItem.objects.create(restaurant=restaurant, product=product)
+
+    def create_product(self, name, category, description):
+        return Product.objects.create(
+            name=name, category=category, description=description, price=100, image=self.image_name,
+        )
+
+    def test_cyrillic_prefixes_ignore_case_and_diacritics(self):
+        self.assertEqual(search_product_ids('ЧИЗ'), [self.cheeseburger.id])
+        self.assertEqual(search_product_ids('ежик'), [self.hedgehog.id])
+        self.assertEqual(search_product_ids('ёж тум'), [self.hedgehog.id])
+        self.assertEqual(search_product_ids('cafe'), [self.latte.id])
+        self.assertEqual(search_product_ids('сыр котлет'), [self.cheeseburger.id])
+        self.assertEqual(search_product_ids('"*) OR ('), [])
+
+    def test_name_matches_rank_higher(self):
+        self.assertEqual(search_product_ids('бургер'), [self.burger.id, self.cheeseburger.id, self.latte.id])
+
+    def test_search_among_products_with_limit(self):
+        self.assertEqual(search_product_ids('бургер', limit=2), [self.burger.id, self.cheeseburger.id])
+        self.assertEqual(
+            search_product_ids('бургер', Product.objects.available(), limit=2),
+            [self.cheeseburger.id, self.latte.id],
+        )
+
+    def test_index_follows_changes(self):
+        self.cheeseburger.name = 'Гамбургер'
+        self.cheeseburger.save()
+        self.drinks.name = 'Горячее'
+        self.drinks.save()
+        self.hedgehog.delete()
+
+        self.assertEqual(search_product_ids('чиз'), [])
+        self.assertEqual(search_product_ids('гамб'), [self.cheeseburger.id])
+        self.assertEqual(search_product_ids('горяч'), [self.latte.id])
+        self.assertEqual(search_product_ids('ежик'), [])
+
+        self.burgers.delete()
+        self.assertEqual(search_product_ids('бургеры'), [])
+
+    def test_api_returns_available_products_by_rank(self):
+        response = self.client.get('/api/products/search/', {'q': 'Бург'})
+
+        self.assertEqual([product['id'] for product in response.json()], [self.cheeseburger.id, self.latte.id])
+
+    @mock.patch('foodcartapp.views.SEARCH_RESULTS_LIMIT', 1)
+    def test_api_returns_limited_results(self):
+        response = self.client.get('/api/products/search/', {'q': 'Бург'})
+
+        self.assertEqual([product['id'] for product in response.json()], [self.cheeseburger.id])
+
+    def test_admin_search(self):
+        self.login_manager()
+
+        response = self.client.get('/admin/foodcartapp/product/', {'q': 'ЁЖИК'})
+
+        self.assertEqual(list(response.context['cl'].result_list), [self.hedgehog])
+
+
+class OrderEventsTest(TestCase):
+    def get_events(self, order):
+        return list(order.events.order_by('pk').values_list('kind', flat=True))
+
+    def test_changes_are_recorded(self):
+        order = Order.objects.create(lastname='Иванов', phonenumber='+79001234567', address='Москва')
+        order.comment = 'Позвонить за час'
+        order.save()
+        order.selected_restaurant = Restaurant.objects.create(name='Star Burger')
+        order.status = Order.OrderStatus.DONE
+        order.save()
+
+        self.assertEqual(self.get_events(order), ['created', 'status_changed', 'restaurant_assigned'])
+
+    def test_deferred_fields_are_not_loaded(self):
+        Order.objects.create(lastname='Иванов', phonenumber='+79001234567', address='Москва')
+
+        with self.assertNumQueries(1):
+            list(Order.objects.only('id'))
+
+    def test_drained_orders_are_recorded(self):
+        insert_orders([{
+            'intake_id': '0b5c4c36-64b5-4ab3-a3a4-8e1d9f3b7c21',
+            'created_at': '2026-10-18T10:00:00+00:00',
+            'firstname': 'Иван',
+            'lastname': 'Иванов',
+            'phonenumber': '+79001234567',
+            'address': 'Москва',
+            'products': [],
+        }])
+
+        event = OrderEvent.objects.get()
+        self.assertEqual(event.kind, 'created')
+        self.assertEqual((event.payload['lastname'], event.payload['total_price']), ('Иванов', '0'))
+
+
+class StaticFilesTest(TestCase):
+    BUNDLE = 'console.log("Star Burger");\n' * 50
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.static_root = tempfile.mkdtemp()
+        cls.source_dir = tempfile.mkdtemp()
+        with open(os.path.join(cls.source_dir, 'index.js'), 'w') as bundle:
+            bundle.write(cls.BUNDLE)
+        cls.static_override = override_settings(
+            STATIC_ROOT=cls.static_root,
+            STATICFILES_DIRS=[cls.source_dir],
+            STATICFILES_FINDERS=['django.contrib.staticfiles.finders.FileSystemFinder'],
+        )
+        cls.static_override.enable()
+        call_command('collectstatic', interactive=False, verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.static_override.disable()
+        shutil.rmtree(cls.static_root, ignore_errors=True)
+        shutil.rmtree(cls.source_dir, ignore_errors=True)
+        super().tearDownClass()
+
+    def test_hashed_bundle_is_precompressed_and_immutable(self):
+        url = staticfiles_storage.url('index.js')
+        self.assertRegex(url, r'^/static/index\.[0-9a-f]{12}\.js$')
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        content = b''.join(response.streaming_content)
+        self.assertLess(len(content), len(self.BUNDLE))
+        self.assertEqual(gzip.decompress(content).decode(), self.BUNDLE)
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_unhashed_name_is_revalidated(self):
+        response = self.client.get('/static/index.js', HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response['Cache-Control'], 'public, max-age=60, must-revalidate')
+        self.assertEqual(b''.join(response.streaming_content).decode(), self.BUNDLE)
+
+    def test_range_requests(self):
+        size = len(self.BUNDLE)
+        response = self.client.get('/static/index.js', HTTP_RANGE='bytes=0-10')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 0-10/{size}')
+        self.assertEqual(response.content.decode(), self.BUNDLE[:11])
+
+        response = self.client.get('/static/index.js', HTTP_RANGE=f'bytes={size}-')
+        self.assertEqual(response.status_code, 416)
+
+        response = self.client.get('/static/index.js', HTTP_RANGE='bytes=0-10', HTTP_IF_RANGE='"outdated"')
+        self.assertEqual(response.status_code, 200)
@@ -0,0 +1,112 @@
+"""Resized variants of product images.
+
+Every width from THUMBNAIL_WIDTHS is saved as JPEG, and as WebP when Pillow
+supports it. Names are derived from the hash of the source image, so the
+same picture uploaded twice shares its thumbnails and browsers can cache them forever.
+"""
+import hashlib
+import io
+import logging
+
+from PIL import Image, features
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_WIDTHS = (100, 300, 600)
+ADMIN_THUMBNAIL_WIDTH = 100
+THUMBNAILS_DIR = 'thumbnails'
+
+JPEG_OPTIONS = {'quality': 85, 'optimize': True, 'progressive': True}
+WEBP_OPTIONS = {'quality': 80, 'method': 6}
+
+
+def get_formats():
+    formats = {'jpeg': ('JPEG', JPEG_OPTIONS)}
+    if features.check('webp'):
+        formats['webp'] = ('WEBP', WEBP_OPTIONS)
+    return formats
+
+
+def flatten(image):
+    """Convert to RGB, putting transparent images on a white background."""
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def encode_variant(image, width, image_format, options):
+    variant = image.copy()
+    variant.thumbnail((width, variant.height), Image.LANCZOS)
+    encoded = io.BytesIO()
+    variant.save(encoded, image_format, **options)
+    return encoded.getvalue()
+
+
+def generate_image_variants(image_file, overwrite=False):
+    """Save thumbnails of the image and return {format: {width: storage name}}.
+
+    Images are never upscaled, so a small source gets fewer variants. Existing
+    thumbnails of the same image are reused unless overwrite is set.
+    """
+    image_file.open('rb')
+    try:
+        source = image_file.read()
+    finally:
+        image_file.close()
+    digest = hashlib.sha256(source).hexdigest()[:16]
+
+    with Image.open(io.BytesIO(source)) as image:
+        image = flatten(image)
+
+    variants = {}
+    widths = [width for width in THUMBNAIL_WIDTHS if width < image.width] or [image.width]
+    for format_name, (image_format, options) in get_formats().items():
+        variants[format_name] = {}
+        for width in widths:
+            name = f'{THUMBNAILS_DIR}/{digest[:2]}/{digest}-{width}.{format_name}'
+            exists = default_storage.exists(name)
+            if exists and overwrite:
+                default_storage.delete(name)
+            if overwrite or not exists:
+                name = default_storage.save(name, ContentFile(encode_variant(image, width, image_format, options)))
+            variants[format_name][str(width)] = name
+    return variants
+
+
+def update_image_variants(product, overwrite=False):
+    """Regenerate thumbnails if the product image has changed since the last time or overwrite is set."""
+    if not overwrite and product.image_variants.get('source') == product.image.name:
+        return False
+
+    image_variants = {'source': product.image.name}
+    if product.image:
+        try:
+            image_variants['formats'] = generate_image_variants(product.image, overwrite)
+        except (OSError, ValueError):
+            logger.exception('Could not make thumbnails of product %s image %s', product.id, product.image.name)
+            return False
+
+    product.image_variants = image_variants
+    type(product).objects.filter(pk=product.pk).update(image_variants=image_variants)
+    return True
+
+
+def get_thumbnail_urls(product):
+    """URLs of thumbnails by format and width, empty if there are none yet."""
+    if product.image_variants.get('source') != product.image.name:
+        return {}
+    return {
+        format_name: {width: default_storage.url(name) for width, name in names.items()}
+        for format_name, names in product.image_variants.get('formats', {}).items()
+    }
+
+
+def get_srcset(urls):
+    return ', '.join(f'{url} {width}w' for width, url in sorted(urls.items(), key=lambda item: int(item[0])))
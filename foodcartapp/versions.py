@@ -0,0 +1,34 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+def _get_version_key(name):
+    return f'foodcartapp:version:{name}'
+
+
+def get_version(name):
+    key = _get_version_key(name)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(name):
+    key = _get_version_key(name)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
+
+
+def bump_version_on_commit(name):
+    """Bump the version now and once more after commit.
+
+    The second bump drops anything cached by other processes from not yet committed data.
+    """
+    bump_version(name)
+    transaction.on_commit(lambda: bump_version(name))
@@ -1,94 +1,209 @@
+import hashlib
+import json
+import uuid
+
+from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 
-from django.db import transaction
-from django.http import JsonResponse
-from django.templatetags.static import static
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
 
-from .models import Product, Order, ProductQuantity
-from .serializers import OrderSerializer, ProductQuantitySerializer
+from .intake import append_order
+from .models import Banner, Product, Order, OrderIdempotencyKey, ProductQuantity
+from .replicas import read_only_view
+from .responses import get_cached_payload, make_payload_response
+from .search import get_search_terms, search_product_ids
+from .serializers import OrderSerializer
+from .thumbnails import get_srcset, get_thumbnail_urls
+from .versions import get_version
 
 
-def banners_list_api(request):
-    # FIXME move data to db?
-    return JsonResponse([
-        {
-            'title': 'Burger',
-            'src': static('burger.jpg'),
-            'text': 'Tasty Burger at your door step',
-        },
-        {
-            'title': 'Spices',
-            'src': static('food.jpg'),
-            'text': 'All Cuisines',
-        },
+CATALOG_CACHE_TIMEOUT = 24 * 60 * 60
+SEARCH_CACHE_TIMEOUT = 60 * 60
+SEARCH_RESULTS_LIMIT = 50
+BANNERS_CACHE_TIMEOUT = 24 * 60 * 60
+BANNERS_MAX_AGE = 60
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+INTAKE_ID_NAMESPACE = uuid.UUID('5d3c1f0e-8f7a-4b8e-9a51-2f1d6c0b7e43')
+
+
+def dump_banners():
+    return [
         {
-            'title': 'New York',
-            'src': static('tasty.jpg'),
-            'text': 'Food is incomplete without a tasty dessert',
+            'title': banner.title,
+            'src': banner.image.url,
+            'text': banner.text,
         }
-    ], safe=False, json_dumps_params={
-        'ensure_ascii': False,
-        'indent': 4,
-    })
+        for banner in Banner.objects.active()
+    ]
 
 
-def product_list_api(request):
-    products = Product.objects.select_related('category').available()
+def get_banners_cache_timeout():
+    next_change = Banner.objects.get_next_change()
+    if not next_change:
+        return BANNERS_CACHE_TIMEOUT
+    return max(1, min(BANNERS_CACHE_TIMEOUT, int((next_change - timezone.now()).total_seconds())))
+
 
-    dumped_products = []
-    for product in products:
-        dumped_product = {
+def banners_list_api(request):
+    cache_key = 'foodcartapp:banners:{}'.format(get_version('banners'))
+    payload = get_cached_payload('banners', cache_key, dump_banners, get_banners_cache_timeout)
+    return make_payload_response(request, payload, cache_control=f'public, max-age={BANNERS_MAX_AGE}')
+
+
+def dump_product(product):
+    thumbnails = get_thumbnail_urls(product)
+    return {
+        'id': product.id,
+        'name': product.name,
+        'price': product.price,
+        'special_status': product.special_status,
+        'description': product.description,
+        'category': {
+            'id': product.category.id,
+            'name': product.category.name,
+        } if product.category else None,
+        'image': product.image.url,
+        'thumbnails': thumbnails,
+        'srcset': {format_name: get_srcset(urls) for format_name, urls in thumbnails.items()},
+        'restaurant': {
             'id': product.id,
             'name': product.name,
-            'price': product.price,
-            'special_status': product.special_status,
-            'description': product.description,
-            'category': {
-                'id': product.category.id,
-                'name': product.category.name,
-            } if product.category else None,
-            'image': product.image.url,
-            'restaurant': {
-                'id': product.id,
-                'name': product.name,
-            }
         }
-        dumped_products.append(dumped_product)
-    return JsonResponse(dumped_products, safe=False, json_dumps_params={
-        'ensure_ascii': False,
-        'indent': 4,
-    })
+    }
+
+
+def dump_products():
+    products = Product.objects.select_related('category').available()
+    return [dump_product(product) for product in products]
+
+
+def dump_found_products(query):
+    product_ids = search_product_ids(query, Product.objects.available(), limit=SEARCH_RESULTS_LIMIT)
+    products = Product.objects.select_related('category').in_bulk(product_ids)
+    return [dump_product(products[product_id]) for product_id in product_ids if product_id in products]
+
+
+@read_only_view
+def product_list_api(request):
+    cache_key = 'foodcartapp:catalog:{}'.format(get_version('catalog'))
+    payload = get_cached_payload('catalog', cache_key, dump_products, CATALOG_CACHE_TIMEOUT)
+    return make_payload_response(request, payload)
+
+
+def product_search_api(request):
+    query = ' '.join(get_search_terms(request.GET.get('q', '')))
+    query_hash = hashlib.sha256(query.encode()).hexdigest()[:32]
+    cache_key = 'foodcartapp:search:{}:{}'.format(get_version('catalog'), query_hash)
+    payload = get_cached_payload('search', cache_key, lambda: dump_found_products(query), SEARCH_CACHE_TIMEOUT)
+    return make_payload_response(request, payload)
+
+
+def get_request_hash(data):
+    encoded_data = json.dumps(data, sort_keys=True, ensure_ascii=False, default=str).encode()
+    return hashlib.sha256(encoded_data).hexdigest()
+
+
+def replay_order_response(idempotency_key, request_hash):
+    if idempotency_key.request_hash != request_hash:
+        return Response(
+            {'detail': 'Ключ Idempotency-Key уже использован для другого заказа.'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    return Response(
+        idempotency_key.response_body,
+        status=idempotency_key.response_status,
+        headers={'Idempotent-Replayed': 'true'},
+    )
 
 
-@transaction.atomic
 @api_view(['POST'])
 def register_order(request):
+    key = request.headers.get('Idempotency-Key')
+    request_hash = None
+    if key is not None:
+        if not 0 < len(key) <= IDEMPOTENCY_KEY_MAX_LENGTH:
+            return Response({'detail': 'Неверный ключ Idempotency-Key.'}, status=status.HTTP_400_BAD_REQUEST)
+        request_hash = get_request_hash(request.data)
+        idempotency_key = OrderIdempotencyKey.objects.filter(key=key).first()
+        if idempotency_key:
+            return replay_order_response(idempotency_key, request_hash)
+
     serializer = OrderSerializer(data=request.data)
     serializer.is_valid(raise_exception=True)
 
-    products = request.data.get('products', [])
-
-    create_order = Order.objects.create(
+    order = Order(
         firstname=serializer.validated_data['firstname'],
         lastname=serializer.validated_data['lastname'],
         phonenumber=serializer.validated_data['phonenumber'],
         address=serializer.validated_data['address']
     )
-
-    create_product_quantity = []
-    for order in products:
-        serializer_pq = ProductQuantitySerializer(data=order)
-        serializer_pq.is_valid(raise_exception=True)
-
-        create_product_quantity.append(ProductQuantity(
-            product=serializer_pq.validated_data['product'],
-            order=create_order,
-            quantity=serializer_pq.validated_data['quantity'],
-            price=serializer_pq.validated_data['product'].price * serializer_pq.validated_data['quantity'],
-
-        ))
-
-    ProductQuantity.objects.bulk_create(create_product_quantity)
-
-    return Response(OrderSerializer(create_order).data)
\ No newline at end of file
+    product_quantities = [
+        ProductQuantity(
+            product=item['product'],
+            quantity=item['quantity'],
+            unit_price=item['product'].price,
+            line_total=item['product'].price * item['quantity'],
+        )
+        for item in serializer.validated_data['products']
+    ]
+    order.total_price = sum(product_quantity.line_total for product_quantity in product_quantities)
+
+    if settings.ORDER_INTAKE_MODE == 'buffered':
+        return accept_buffered_order(order, product_quantities, key, request_hash)
+
+    try:
+        with transaction.atomic():
+            order.save()
+            for product_quantity in product_quantities:
+                product_quantity.order = order
+            ProductQuantity.objects.bulk_create(product_quantities)
+            response_body = OrderSerializer(order).data
+
+            if key is not None:
+                OrderIdempotencyKey.objects.create(
+                    key=key,
+                    request_hash=request_hash,
+                    response_status=status.HTTP_200_OK,
+                    response_body=response_body,
+                    order=order,
+                )
+    except IntegrityError:
+        idempotency_key = OrderIdempotencyKey.objects.filter(key=key).first() if key is not None else None
+        if not idempotency_key:
+            raise
+        return replay_order_response(idempotency_key, request_hash)
+
+    return Response(response_body)
+
+
+def accept_buffered_order(order, product_quantities, key, request_hash):
+    """Put the validated order to the intake buffer and answer before it reaches the database."""
+    # Retries with the same key produce the same intake id, so the drain inserts the order once
+    order.intake_id = uuid.uuid5(INTAKE_ID_NAMESPACE, key) if key is not None else uuid.uuid4()
+    response_body = OrderSerializer(order).data
+
+    # The key is claimed before the order is buffered, so of concurrent requests with the
+    # same key only the one answered with 202 reaches the buffer
+    if key is not None:
+        try:
+            with transaction.atomic():
+                idempotency_key = OrderIdempotencyKey.objects.create(
+                    key=key,
+                    request_hash=request_hash,
+                    response_status=status.HTTP_202_ACCEPTED,
+                    response_body=response_body,
+                )
+        except IntegrityError:
+            return replay_order_response(OrderIdempotencyKey.objects.get(key=key), request_hash)
+
+    try:
+        append_order(order, product_quantities)
+    except Exception:
+        if key is not None:
+            idempotency_key.delete()
+        raise
+
+    return Response(response_body, status=status.HTTP_202_ACCEPTED)
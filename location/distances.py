@@ -0,0 +1,54 @@
+import numpy as np
+
+from geopy.distance import distance
+
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def _as_coordinates_array(coordinates):
+    return np.array(
+        [(lat, lng) if lat is not None and lng is not None else (np.nan, np.nan) for lat, lng in coordinates],
+        dtype=float,
+    ).reshape(-1, 2)
+
+
+def get_distance_matrix(origins, destinations):
+    """Return haversine distances in km between every origin and every destination.
+
+    Coordinates are (lat, lng) pairs, unknown coordinates give NaN distances.
+    """
+    origins = np.radians(_as_coordinates_array(origins))
+    destinations = np.radians(_as_coordinates_array(destinations))
+
+    origin_lats = origins[:, 0, np.newaxis]
+    origin_lngs = origins[:, 1, np.newaxis]
+    destination_lats = destinations[np.newaxis, :, 0]
+    destination_lngs = destinations[np.newaxis, :, 1]
+
+    haversine = (
+        np.sin((destination_lats - origin_lats) / 2) ** 2
+        + np.cos(origin_lats) * np.cos(destination_lats) * np.sin((destination_lngs - origin_lngs) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(haversine, 0, 1)))
+
+
+def refine_nearest_distances(distances, origins, destinations, top_k, mask=None):
+    """Replace the top_k smallest distances of every row with geodesic ones.
+
+    Only cells allowed by the boolean mask are considered. The matrix is updated in place.
+    """
+    if not top_k or not distances.size:
+        return distances
+
+    candidates = np.where(np.isnan(distances), np.inf, distances)
+    if mask is not None:
+        candidates = np.where(mask, candidates, np.inf)
+
+    top_k = min(top_k, distances.shape[1])
+    nearest_columns = np.argpartition(candidates, top_k - 1, axis=1)[:, :top_k]
+    for row, columns in enumerate(nearest_columns):
+        for column in columns:
+            if np.isfinite(candidates[row, column]):
+                distances[row, column] = distance(origins[row], destinations[column]).km
+    return distances
@@ -0,0 +1,41 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from location.models import Location
+from location.views import refresh_locations
+
+
+class Command(BaseCommand):
+    help = 'Geocode again the addresses whose cached coordinates are expired or about to expire'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='How many addresses to geocode at once')
+        parser.add_argument('--ahead', type=int, default=0, help='Also refresh locations expiring within this many seconds')
+        parser.add_argument('--loop', action='store_true', help='Keep refreshing instead of exiting when done')
+        parser.add_argument('--interval', type=int, default=60, help='Seconds to sleep between passes with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            refreshed_count = self.refresh_expiring(options['batch_size'], timedelta(seconds=options['ahead']))
+            self.stdout.write(f'Refreshed {refreshed_count} locations')
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def refresh_expiring(self, batch_size, ahead):
+        refreshed_count = 0
+        last_id = 0
+        while True:
+            batch = list(
+                Location.objects
+                .expired(at=timezone.now() + ahead)
+                .filter(pk__gt=last_id)
+                .order_by('pk')[:batch_size]
+            )
+            if not batch:
+                return refreshed_count
+            refreshed_count += len(refresh_locations(batch))
+            last_id = batch[-1].pk
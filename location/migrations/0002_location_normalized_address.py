@@ -0,0 +1,43 @@
+from django.db import migrations, models
+
+from location.normalization import normalize_address
+
+
+def fill_normalized_address(apps, schema_editor):
+    Location = apps.get_model('location', 'Location')
+    geocoded = Location.objects.exclude(lat=None).order_by('-update_date')
+    not_found = Location.objects.filter(lat=None).order_by('-update_date')
+
+    kept_keys = set()
+    duplicate_ids = []
+    for locations in (geocoded, not_found):
+        for location_id, address in locations.values_list('pk', 'address').iterator():
+            normalized_address = normalize_address(address)
+            if normalized_address in kept_keys:
+                duplicate_ids.append(location_id)
+                continue
+            kept_keys.add(normalized_address)
+            Location.objects.filter(pk=location_id).update(normalized_address=normalized_address)
+    Location.objects.filter(pk__in=duplicate_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('location', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='normalized_address',
+            field=models.CharField(default='', editable=False, max_length=200, verbose_name='Нормализованный адрес'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_normalized_address, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='location',
+            name='normalized_address',
+            field=models.CharField(editable=False, max_length=200, unique=True, verbose_name='Нормализованный адрес'),
+        ),
+    ]
@@ -1,10 +1,40 @@
+from datetime import timedelta
+
+from django.conf import settings
 from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+from .normalization import normalize_address
+
+
+class LocationQuerySet(models.QuerySet):
+    def expired(self, at=None):
+        """Locations whose coordinates are outdated at the given moment, now by default."""
+        at = at or timezone.now()
+        return self.filter(
+            Q(lat__isnull=False, update_date__lt=at - timedelta(seconds=settings.GEOCODE_TTL))
+            | Q(lat__isnull=True, update_date__lt=at - timedelta(seconds=settings.GEOCODE_NEGATIVE_TTL))
+        )
+
 
 class Location(models.Model):
     address = models.CharField(max_length=200, unique=True, verbose_name='Адрес')
+    normalized_address = models.CharField(max_length=200, unique=True, editable=False, verbose_name='Нормализованный адрес')
     lat = models.FloatField(null=True, blank=True, verbose_name='Широта координат')
     lng = models.FloatField(null=True, blank=True, verbose_name='Долгота координат')
     update_date = models.DateTimeField(auto_now=True, db_index=True, verbose_name='Когда был запрос')
 
+    objects = LocationQuerySet.as_manager()
+
     def __str__(self):
         return self.address
+
+    def save(self, *args, **kwargs):
+        self.normalized_address = normalize_address(self.address)
+        super().save(*args, **kwargs)
+
+    @property
+    def is_expired(self):
+        ttl = settings.GEOCODE_TTL if self.lat is not None else settings.GEOCODE_NEGATIVE_TTL
+        return self.update_date < timezone.now() - timedelta(seconds=ttl)
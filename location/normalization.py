@@ -0,0 +1,68 @@
+import re
+import unicodedata
+from difflib import SequenceMatcher
+
+
+ABBREVIATIONS = {
+    'г': 'город',
+    'гор': 'город',
+    'обл': 'область',
+    'р-н': 'район',
+    'ул': 'улица',
+    'пр': 'проспект',
+    'пр-т': 'проспект',
+    'пр-кт': 'проспект',
+    'просп': 'проспект',
+    'пер': 'переулок',
+    'пл': 'площадь',
+    'наб': 'набережная',
+    'ш': 'шоссе',
+    'б-р': 'бульвар',
+    'бул': 'бульвар',
+    'туп': 'тупик',
+    'мкр': 'микрорайон',
+    'мкрн': 'микрорайон',
+    'стр': 'строение',
+    'корп': 'корпус',
+    'к': 'корпус',
+    'кв': 'квартира',
+    'под': 'подъезд',
+}
+
+NOISE_WORDS = {'д', 'дом'}
+
+TOKEN_PATTERN = re.compile(r'[^\W_]+(?:-[^\W_]+)*')
+
+
+def normalize_address(address):
+    """Bring differently written forms of an address to one key.
+
+    "ул. Ленина, д. 5" and "улица Ленина 5 " both become "улица ленина 5".
+    """
+    address = unicodedata.normalize('NFKC', address).casefold().replace('ё', 'е')
+    tokens = []
+    for token in TOKEN_PATTERN.findall(address):
+        if token in NOISE_WORDS:
+            continue
+        tokens.append(ABBREVIATIONS.get(token, token))
+    return ' '.join(tokens)
+
+
+def _get_number_tokens(tokens):
+    return {token for token in tokens if any(char.isdigit() for char in token)}
+
+
+def get_token_set_ratio(first, second):
+    """Similarity of two normalized addresses from 0 to 1 ignoring the order of words.
+
+    Addresses with different house, building or flat numbers never match.
+    """
+    first_tokens = set(first.split())
+    second_tokens = set(second.split())
+    if _get_number_tokens(first_tokens) != _get_number_tokens(second_tokens):
+        return 0
+
+    common = ' '.join(sorted(first_tokens & second_tokens))
+    first_combined = ' '.join([common, *sorted(first_tokens - second_tokens)]).strip()
+    second_combined = ' '.join([common, *sorted(second_tokens - first_tokens)]).strip()
+    return SequenceMatcher(None, first_combined, second_combined).ratio()
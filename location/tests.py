@@ -1,3 +1,272 @@
-from django.test import TestCase
+import io
+import json
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+import numpy as np
+from geopy.distance import distance as geodesic_distance
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from .distances import get_distance_matrix, refine_nearest_distances
+from .models import Location
+from .views import get_or_create_locations
+
+
+class StandInGeocoder(ThreadingHTTPServer):
+    """Local server that answers like the Yandex geocoder after a delay."""
+
+    daemon_threads = True
+
+    def __init__(self, latency=0, coordinates=None, failures=None):
+        super().__init__(('127.0.0.1', 0), StandInGeocoderHandler)
+        self.latency = latency
+        self.coordinates = coordinates or {}
+        self.failures = failures or {}
+        self.requested_addresses = []
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address
+        return f'http://{host}:{port}/1.x'
+
+
+class StandInGeocoderHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        address = parse_qs(urlparse(self.path).query)['geocode'][0]
+        with self.server.lock:
+            self.server.requested_addresses.append(address)
+            failures_left = self.server.failures.get(address, 0)
+            if failures_left:
+                self.server.failures[address] = failures_left - 1
+        time.sleep(self.server.latency)
+
+        if failures_left:
+            self.send_response(503)
+            self.end_headers()
+            return
+
+        found_places = []
+        if address in self.server.coordinates:
+            lat, lng = self.server.coordinates[address]
+            found_places.append({'GeoObject': {'Point': {'pos': f'{lng} {lat}'}}})
+        body = json.dumps({'response': {'GeoObjectCollection': {'featureMember': found_places}}}).encode()
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInGeocoderTestCase(TestCase):
+    def start_geocoder(self, **kwargs):
+        geocoder = StandInGeocoder(**kwargs)
+        thread = threading.Thread(target=geocoder.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(geocoder.server_close)
+        self.addCleanup(geocoder.shutdown)
+
+        settings_override = override_settings(
+            GEOCODER_URL=geocoder.url,
+            GEOCODER_MAX_WORKERS=10,
+            GEOCODER_TIMEOUT=2,
+            GEOCODER_RETRIES=2,
+            GEOCODER_RETRY_BACKOFF=0,
+            GEOCODE_BACKGROUND_REFRESH=False,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        return geocoder
+
+
+class GetOrCreateLocationsTest(StandInGeocoderTestCase):
+    def test_unknown_addresses_are_geocoded_concurrently(self):
+        addresses = [f'Москва, Тверская {number}' for number in range(10)]
+        geocoder = self.start_geocoder(
+            latency=0.2,
+            coordinates={address: (55 + number, 37.6) for number, address in enumerate(addresses)},
+        )
+
+        started_at = time.monotonic()
+        with self.assertNumQueries(2):
+            locations = get_or_create_locations(*addresses)
+        elapsed = time.monotonic() - started_at
+
+        self.assertLess(elapsed, 1, 'addresses must not be geocoded one by one')
+        self.assertEqual(sorted(geocoder.requested_addresses), sorted(addresses))
+        self.assertEqual(locations[addresses[3]], (58, 37.6))
+        self.assertEqual(Location.objects.count(), len(addresses))
+
+    def test_known_addresses_are_not_geocoded(self):
+        Location.objects.create(address='Москва, Арбат 1', lat=55.75, lng=37.59)
+        geocoder = self.start_geocoder()
+
+        locations = get_or_create_locations('Москва, Арбат 1')
+
+        self.assertEqual(locations, {'Москва, Арбат 1': (55.75, 37.59)})
+        self.assertEqual(geocoder.requested_addresses, [])
+
+    def test_not_found_address_is_stored_without_coordinates(self):
+        self.start_geocoder()
+
+        locations = get_or_create_locations('Нигде')
+
+        self.assertEqual(locations, {'Нигде': (None, None)})
+        self.assertTrue(Location.objects.filter(address='Нигде', lat=None, lng=None).exists())
+
+    def test_server_errors_are_retried(self):
+        geocoder = self.start_geocoder(coordinates={'Москва, Арбат 1': (55.75, 37.59)}, failures={'Москва, Арбат 1': 2})
+
+        locations = get_or_create_locations('Москва, Арбат 1')
+
+        self.assertEqual(locations, {'Москва, Арбат 1': (55.75, 37.59)})
+        self.assertEqual(len(geocoder.requested_addresses), 3)
+
+    def test_differently_written_addresses_share_one_location(self):
+        geocoder = self.start_geocoder(coordinates={'ул. Ленина, 5': (55.75, 37.59)})
+
+        locations = get_or_create_locations('ул. Ленина, 5', 'улица Ленина 5 ')
+        locations.update(get_or_create_locations('УЛ. ЛЕНИНА, Д. 5'))
+
+        self.assertEqual(set(locations.values()), {(55.75, 37.59)})
+        self.assertEqual(geocoder.requested_addresses, ['ул. Ленина, 5'])
+        self.assertEqual(Location.objects.count(), 1)
+
+    def test_similar_address_is_found_with_fuzzy_match(self):
+        Location.objects.create(address='Москва, ул. Ленина, 5', lat=55.75, lng=37.59)
+        geocoder = self.start_geocoder()
+
+        with self.settings(GEOCODE_FUZZY_MATCH_THRESHOLD=0.8):
+            locations = get_or_create_locations('Ленина улица 5', 'Москва, ул. Ленина, 7')
+
+        self.assertEqual(locations['Ленина улица 5'], (55.75, 37.59))
+        self.assertEqual(geocoder.requested_addresses, ['Москва, ул. Ленина, 7'])
+
+    def test_unanswered_address_is_not_stored(self):
+        self.start_geocoder(failures={'Москва, Арбат 1': 10})
+
+        with self.assertLogs('location.views', level='ERROR'):
+            locations = get_or_create_locations('Москва, Арбат 1')
+
+        self.assertEqual(locations, {'Москва, Арбат 1': (None, None)})
+        self.assertFalse(Location.objects.exists())
+
+
+@override_settings(GEOCODE_TTL=60 * 60, GEOCODE_NEGATIVE_TTL=60)
+class LocationExpirationTest(StandInGeocoderTestCase):
+    def create_location(self, address, lat, lng, age):
+        location = Location.objects.create(address=address, lat=lat, lng=lng)
+        Location.objects.filter(pk=location.pk).update(update_date=timezone.now() - age)
+
+    def test_expired_location_is_served_without_waiting_for_geocoder(self):
+        self.create_location('Москва, Арбат 1', 55.75, 37.59, age=timedelta(days=1))
+        geocoder = self.start_geocoder(coordinates={'Москва, Арбат 1': (55.76, 37.6)})
+
+        locations = get_or_create_locations('Москва, Арбат 1')
+
+        self.assertEqual(locations, {'Москва, Арбат 1': (55.75, 37.59)})
+        self.assertEqual(geocoder.requested_addresses, [])
+
+    def test_negative_entries_expire_sooner(self):
+        self.create_location('Москва, Арбат 1', 55.75, 37.59, age=timedelta(minutes=10))
+        self.create_location('Нигде', None, None, age=timedelta(minutes=10))
+
+        expired_addresses = list(Location.objects.expired().values_list('address', flat=True))
+
+        self.assertEqual(expired_addresses, ['Нигде'])
+
+    def test_refresh_command_updates_expired_locations(self):
+        self.create_location('Москва, Арбат 1', None, None, age=timedelta(minutes=10))
+        self.create_location('Москва, Тверская 1', 55.76, 37.61, age=timedelta(minutes=10))
+        geocoder = self.start_geocoder(coordinates={'Москва, Арбат 1': (55.75, 37.59)})
+
+        call_command('refresh_locations', batch_size=1, stdout=io.StringIO())
+
+        self.assertEqual(geocoder.requested_addresses, ['Москва, Арбат 1'])
+        location = Location.objects.get(address='Москва, Арбат 1')
+        self.assertEqual((location.lat, location.lng), (55.75, 37.59))
+        self.assertFalse(location.is_expired)
+
+
+class DistancesTest(SimpleTestCase):
+    ORDERS = [(55.7558, 37.6173), (59.9343, 30.3351), (None, None)]
+    RESTAURANTS = [(55.7522, 37.6156), (56.8389, 60.6057), (55.7963, 49.1088), (None, 37.6)]
+
+    def get_refined_cells(self, distances, haversine):
+        refined = (distances != haversine) & ~np.isnan(haversine)
+        return [(row, column) for row, column in np.argwhere(refined).tolist()]
+
+    def test_haversine_is_close_to_geodesic(self):
+        distances = get_distance_matrix(self.ORDERS[:2], self.RESTAURANTS[:3])
+
+        for row, order in enumerate(self.ORDERS[:2]):
+            for column, restaurant in enumerate(self.RESTAURANTS[:3]):
+                with self.subTest(order=order, restaurant=restaurant):
+                    geodesic_km = geodesic_distance(order, restaurant).km
+                    self.assertAlmostEqual(distances[row, column], geodesic_km, delta=max(0.005 * geodesic_km, 0.01))
+
+    def test_unknown_coordinates_give_nan(self):
+        distances = get_distance_matrix(self.ORDERS, self.RESTAURANTS)
+
+        self.assertEqual(distances.shape, (3, 4))
+        self.assertTrue(np.isnan(distances[2]).all())
+        self.assertTrue(np.isnan(distances[:, 3]).all())
+        self.assertFalse(np.isnan(distances[:2, :3]).any())
+
+    def test_empty_inputs(self):
+        self.assertEqual(get_distance_matrix([], self.RESTAURANTS).shape, (0, 4))
+        self.assertEqual(get_distance_matrix(self.ORDERS, []).shape, (3, 0))
+
+    def test_only_nearest_distances_are_refined(self):
+        distances = get_distance_matrix(self.ORDERS, self.RESTAURANTS)
+        haversine = distances.copy()
+
+        refine_nearest_distances(distances, self.ORDERS, self.RESTAURANTS, top_k=1)
+
+        # Moscow is the nearest to both orders
+        for row, column in [(0, 0), (1, 0)]:
+            self.assertEqual(distances[row, column], geodesic_distance(self.ORDERS[row], self.RESTAURANTS[column]).km)
+        self.assertEqual(self.get_refined_cells(distances, haversine), [(0, 0), (1, 0)])
+
+    def test_mask_excludes_unavailable_restaurants(self):
+        distances = get_distance_matrix(self.ORDERS, self.RESTAURANTS)
+        haversine = distances.copy()
+        mask = np.array([
+            [False, True, True, True],
+            [False, True, True, True],
+            [True, True, True, True],
+        ])
+
+        refine_nearest_distances(distances, self.ORDERS, self.RESTAURANTS, top_k=1, mask=mask)
+
+        # Kazan is the nearest of the restaurants that have the products
+        self.assertEqual(self.get_refined_cells(distances, haversine), [(0, 2), (1, 2)])
+
+    def test_top_k_larger_than_restaurants_count(self):
+        distances = get_distance_matrix(self.ORDERS, self.RESTAURANTS)
+
+        refine_nearest_distances(distances, self.ORDERS, self.RESTAURANTS, top_k=10)
+
+        for row in range(2):
+            for column in range(3):
+                self.assertEqual(distances[row, column], geodesic_distance(self.ORDERS[row], self.RESTAURANTS[column]).km)
+        self.assertTrue(np.isnan(distances[2]).all())
+        self.assertTrue(np.isnan(distances[:, 3]).all())
+
+    def test_refinement_is_off_by_default(self):
+        distances = get_distance_matrix(self.ORDERS, self.RESTAURANTS)
+        haversine = distances.copy()
+
+        refine_nearest_distances(distances, self.ORDERS, self.RESTAURANTS, top_k=0)
+
+        np.testing.assert_array_equal(distances, haversine)
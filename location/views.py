@@ -1,12 +1,46 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
+from requests.adapters import HTTPAdapter
 
 from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.utils import timezone
+
+from monitoring import metrics
+
 from .models import Location
+from .normalization import get_token_set_ratio, normalize_address
+
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
 
+REFRESH_LOCK_TIMEOUT = 5 * 60
+FUZZY_MATCH_CANDIDATES = 50
 
-def fetch_coordinates(apikey, address):
-    base_url = "https://geocode-maps.yandex.ru/1.x"
-    response = requests.get(base_url, params={"geocode": address, "apikey": apikey, "format": "json"})
+_session = None
+_refresh_executor = None
+
+
+def get_session():
+    global _session
+    if _session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=settings.GEOCODER_MAX_WORKERS)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _session = session
+    return _session
+
+
+def fetch_coordinates(apikey, address, session=requests, timeout=None):
+    base_url = settings.GEOCODER_URL
+    response = session.get(base_url, params={"geocode": address, "apikey": apikey, "format": "json"}, timeout=timeout)
     response.raise_for_status()
 
     found_places = response.json()['response']['GeoObjectCollection']['featureMember']
@@ -17,21 +51,171 @@ def fetch_coordinates(apikey, address):
     return lng, lat
 
 
-def get_or_create_locations(*addresses):
-    api_key = settings.YANDEX_API_KEY
-    addresses = [*addresses]
-    locations = {location.address: (location.lat, location.lng) for location in Location.objects.filter(address__in=addresses)}
+def fetch_measured_coordinates(apikey, address, session, timeout):
+    started_at = time.perf_counter()
+    outcome = 'error'
+    try:
+        coordinates = fetch_coordinates(apikey, address, session=session, timeout=timeout)
+        outcome = 'found' if coordinates else 'not_found'
+        return coordinates
+    finally:
+        metrics.increment('starburger_geocoder_requests_total', {'outcome': outcome})
+        metrics.observe('starburger_geocoder_request_duration_seconds', {}, time.perf_counter() - started_at)
+
+
+def fetch_coordinates_with_retries(apikey, address, session=requests):
+    for attempt in range(settings.GEOCODER_RETRIES + 1):
+        try:
+            return fetch_measured_coordinates(apikey, address, session=session, timeout=settings.GEOCODER_TIMEOUT)
+        except requests.HTTPError as error:
+            if error.response is None or error.response.status_code not in RETRY_STATUS_CODES:
+                raise
+            if attempt == settings.GEOCODER_RETRIES:
+                raise
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == settings.GEOCODER_RETRIES:
+                raise
+        time.sleep(settings.GEOCODER_RETRY_BACKOFF * 2 ** attempt)
+
+
+def geocode_addresses(apikey, addresses):
+    """Geocode addresses concurrently through one keep-alive session.
+
+    Returns {address: (lat, lng)}, coordinates are None for addresses the geocoder does not know.
+    Addresses that could not be geocoded because of network or server errors are left out.
+    """
+    session = get_session()
 
-    for address in addresses:
-        if address in [location for location in locations.keys()]:
+    def geocode(address):
+        try:
+            return address, fetch_coordinates_with_retries(apikey, address, session=session)
+        except requests.RequestException:
+            logger.exception('Could not geocode address %r', address)
+            return address, False
+
+    max_workers = max(1, min(settings.GEOCODER_MAX_WORKERS, len(addresses)))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(geocode, addresses))
+
+    geocoded = {}
+    for address, coordinates in results:
+        if coordinates is False:
             continue
-        coordinates = fetch_coordinates(api_key, address)
         if coordinates:
-            coordinates_lng, coordinates_lat = coordinates
+            lng, lat = coordinates
+            geocoded[address] = (float(lat), float(lng))
         else:
-            coordinates_lng, coordinates_lat = None, None
-        new_locate = Location.objects.create(address=address, lat=coordinates_lat, lng=coordinates_lng)
-        locations[new_locate.address] = (new_locate.lat, new_locate.lng)
-    return locations
+            geocoded[address] = (None, None)
+    return geocoded
+
+
+def refresh_locations(locations):
+    """Geocode the locations again and store fresh coordinates.
 
+    Locations the geocoder could not answer keep their previous coordinates.
+    """
+    locations = list(locations)
+    if not locations:
+        return []
 
+    geocoded = geocode_addresses(settings.YANDEX_API_KEY, [location.address for location in locations])
+    refreshed_at = timezone.now()
+    refreshed = []
+    for location in locations:
+        if location.address not in geocoded:
+            continue
+        location.lat, location.lng = geocoded[location.address]
+        location.update_date = refreshed_at
+        refreshed.append(location)
+    Location.objects.bulk_update(refreshed, ['lat', 'lng', 'update_date'])
+    return refreshed
+
+
+def _refresh_in_background(location_ids):
+    try:
+        refresh_locations(Location.objects.filter(pk__in=location_ids))
+    except Exception:
+        logger.exception('Could not refresh locations')
+    finally:
+        connection.close()
+
+
+def schedule_refresh(locations):
+    """Refresh expired locations in a background thread without blocking the caller."""
+    global _refresh_executor
+
+    location_ids = [
+        location.pk for location in locations
+        if cache.add(f'location:refresh:{location.pk}', True, REFRESH_LOCK_TIMEOUT)
+    ]
+    if not location_ids:
+        return
+    if _refresh_executor is None:
+        _refresh_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='location-refresh')
+    _refresh_executor.submit(_refresh_in_background, location_ids)
+
+
+def find_similar_location(normalized_address):
+    """Find a stored location whose normalized address differs only slightly."""
+    words = sorted(
+        (word for word in normalized_address.split() if not any(char.isdigit() for char in word)),
+        key=len,
+        reverse=True,
+    )
+    if not words:
+        return None
+
+    candidates = Location.objects.filter(normalized_address__contains=words[0])[:FUZZY_MATCH_CANDIDATES]
+    best_ratio, best_location = 0, None
+    for candidate in candidates:
+        ratio = get_token_set_ratio(normalized_address, candidate.normalized_address)
+        if ratio > best_ratio:
+            best_ratio, best_location = ratio, candidate
+    if best_ratio >= settings.GEOCODE_FUZZY_MATCH_THRESHOLD:
+        return best_location
+    return None
+
+
+def get_or_create_locations(*addresses):
+    api_key = settings.YANDEX_API_KEY
+    normalized_addresses = {address: normalize_address(address) for address in addresses}
+    known_locations = {
+        location.normalized_address: location
+        for location in Location.objects.filter(normalized_address__in=set(normalized_addresses.values()))
+    }
+
+    if settings.GEOCODE_FUZZY_MATCH_THRESHOLD is not None:
+        for normalized_address in set(normalized_addresses.values()) - set(known_locations):
+            similar_location = find_similar_location(normalized_address)
+            if similar_location:
+                known_locations[normalized_address] = similar_location
+
+    expired_locations = {location for location in known_locations.values() if location.is_expired}
+    if expired_locations and settings.GEOCODE_BACKGROUND_REFRESH:
+        schedule_refresh(expired_locations)
+
+    unknown_addresses = {}
+    for address, normalized_address in normalized_addresses.items():
+        if normalized_address not in known_locations:
+            unknown_addresses.setdefault(normalized_address, address)
+    metrics.record_cache_access('locations', hit=True, count=len(known_locations))
+    metrics.record_cache_access('locations', hit=False, count=len(unknown_addresses))
+
+    geocoded = geocode_addresses(api_key, list(unknown_addresses.values())) if unknown_addresses else {}
+    if geocoded:
+        Location.objects.bulk_create(
+            [
+                Location(address=address, normalized_address=normalize_address(address), lat=lat, lng=lng)
+                for address, (lat, lng) in geocoded.items()
+            ],
+            ignore_conflicts=True,
+        )
+
+    locations = {}
+    for address, normalized_address in normalized_addresses.items():
+        if normalized_address in known_locations:
+            location = known_locations[normalized_address]
+            locations[address] = (location.lat, location.lng)
+        else:
+            locations[address] = geocoded.get(unknown_addresses[normalized_address], (None, None))
+    return locations
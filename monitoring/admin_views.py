@@ -0,0 +1,38 @@
+import os
+
+from django.contrib import admin
+from django.http import FileResponse, Http404
+from django.template.response import TemplateResponse
+
+from .profiling import get_profile_path, get_recent_profiles, load_profile
+
+
+def profile_list(request):
+    return TemplateResponse(request, 'admin/monitoring/profiles.html', {
+        **admin.site.each_context(request),
+        'title': 'Профили запросов',
+        'profiles': get_recent_profiles(),
+    })
+
+
+def profile_detail(request, profile_id):
+    try:
+        profile = load_profile(profile_id)
+    except (OSError, ValueError):
+        raise Http404('Профиль не найден')
+
+    return TemplateResponse(request, 'admin/monitoring/profile_detail.html', {
+        **admin.site.each_context(request),
+        'title': f'Профиль {profile["method"]} {profile["path"]}',
+        'profile': profile,
+    })
+
+
+def profile_download(request, profile_id):
+    try:
+        profile_path = get_profile_path(profile_id, 'prof')
+    except ValueError:
+        raise Http404('Профиль не найден')
+    if not os.path.exists(profile_path):
+        raise Http404('Профиль не найден')
+    return FileResponse(open(profile_path, 'rb'), as_attachment=True, filename=os.path.basename(profile_path))
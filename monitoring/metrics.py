@@ -0,0 +1,246 @@
+"""Process-local counters and histograms with file-based aggregation across processes.
+
+Every process keeps its metrics in memory and regularly dumps them to its own
+file in METRICS_DIR. The /metrics endpoint sums up all the files, so any worker
+can answer for the whole server. Files of finished processes are merged into
+one file per host, so the counters never go back and the directory doesn't grow
+as workers are recycled.
+"""
+import atexit
+import bisect
+import contextlib
+import fcntl
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+METRICS = {
+    'starburger_http_requests_total': ('counter', 'HTTP requests by view, method and status class.'),
+    'starburger_http_request_duration_seconds': ('histogram', 'Time to respond to HTTP requests by view.'),
+    'starburger_db_queries_total': ('counter', 'SQL queries made while handling requests by view.'),
+    'starburger_db_query_duration_seconds_total': ('counter', 'Time spent in SQL queries by view.'),
+    'starburger_geocoder_requests_total': ('counter', 'Requests to the geocoder by outcome.'),
+    'starburger_geocoder_request_duration_seconds': ('histogram', 'Time to get an answer from the geocoder.'),
+    'starburger_cache_requests_total': ('counter', 'Reads of cached data by cache name and result.'),
+}
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_last_flush = time.monotonic()
+
+
+def _get_labels_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def increment(name, labels, value=1):
+    key = (name, _get_labels_key(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, labels, value):
+    """Put the value into the histogram buckets."""
+    key = (name, _get_labels_key(labels))
+    bucket = bisect.bisect_left(LATENCY_BUCKETS, value)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {'buckets': [0] * (len(LATENCY_BUCKETS) + 1), 'sum': 0, 'count': 0}
+        histogram['buckets'][bucket] += 1
+        histogram['sum'] += value
+        histogram['count'] += 1
+
+
+def record_cache_access(cache_name, hit, count=1):
+    increment('starburger_cache_requests_total', {'cache': cache_name, 'result': 'hit' if hit else 'miss'}, count)
+
+
+def _get_snapshot():
+    with _lock:
+        return {
+            'counters': [[name, labels, value] for (name, labels), value in _counters.items()],
+            'histograms': [
+                [name, labels, histogram['buckets'].copy(), histogram['sum'], histogram['count']]
+                for (name, labels), histogram in _histograms.items()
+            ],
+        }
+
+
+def _get_process_file_path():
+    return os.path.join(settings.METRICS_DIR, f'{socket.gethostname()}-{os.getpid()}.json')
+
+
+def _get_finished_processes_file_path():
+    return os.path.join(settings.METRICS_DIR, f'{socket.gethostname()}-finished.json')
+
+
+def _write_snapshot(snapshot, path):
+    file_descriptor, temp_path = tempfile.mkstemp(dir=settings.METRICS_DIR, suffix='.tmp')
+    with os.fdopen(file_descriptor, 'w') as temp_file:
+        json.dump(snapshot, temp_file)
+    os.replace(temp_path, path)
+
+
+def _read_snapshot(path):
+    try:
+        with open(path) as metrics_file:
+            return json.load(metrics_file)
+    except (OSError, ValueError):
+        return None
+
+
+def flush():
+    """Atomically replace the file of this process with the current metrics."""
+    global _last_flush
+    _last_flush = time.monotonic()
+    if not settings.METRICS_DIR:
+        return
+
+    os.makedirs(settings.METRICS_DIR, exist_ok=True)
+    _write_snapshot(_get_snapshot(), _get_process_file_path())
+
+
+@contextlib.contextmanager
+def _lock_metrics_dir(operation):
+    """Keep scrapes from reading the directory while finished processes are being merged."""
+    with open(os.path.join(settings.METRICS_DIR, 'merge.lock'), 'w') as lock_file:
+        fcntl.flock(lock_file, operation)
+        yield
+
+
+def _is_process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _get_finished_process_files():
+    prefix = f'{socket.gethostname()}-'
+    paths = []
+    for filename in os.listdir(settings.METRICS_DIR):
+        pid = filename[len(prefix):-len('.json')]
+        if not filename.startswith(prefix) or not filename.endswith('.json') or not pid.isdigit():
+            continue
+        if not _is_process_alive(int(pid)):
+            paths.append(os.path.join(settings.METRICS_DIR, filename))
+    return paths
+
+
+def merge_finished_processes():
+    """Fold files of finished processes of this host into a single file.
+
+    Other hosts may share the directory, so only workers of this host are checked.
+    """
+    if not settings.METRICS_DIR or not _get_finished_process_files():
+        return
+
+    with _lock_metrics_dir(fcntl.LOCK_EX):
+        paths = _get_finished_process_files()
+        snapshots = [_read_snapshot(path) for path in paths]
+        finished_processes_file_path = _get_finished_processes_file_path()
+        snapshots.append(_read_snapshot(finished_processes_file_path))
+        counters, histograms = _sum_snapshots(snapshot for snapshot in snapshots if snapshot)
+        _write_snapshot(
+            {
+                'counters': [[name, labels, value] for (name, labels), value in counters.items()],
+                'histograms': [
+                    [name, labels, histogram['buckets'], histogram['sum'], histogram['count']]
+                    for (name, labels), histogram in histograms.items()
+                ],
+            },
+            finished_processes_file_path,
+        )
+        for path in paths:
+            os.remove(path)
+
+
+def flush_if_due():
+    if time.monotonic() - _last_flush >= settings.METRICS_FLUSH_INTERVAL:
+        flush()
+
+
+def _load_snapshots():
+    if not settings.METRICS_DIR:
+        return [_get_snapshot()]
+
+    flush()
+    merge_finished_processes()
+    snapshots = []
+    with _lock_metrics_dir(fcntl.LOCK_SH):
+        for filename in os.listdir(settings.METRICS_DIR):
+            if not filename.endswith('.json'):
+                continue
+            snapshot = _read_snapshot(os.path.join(settings.METRICS_DIR, filename))
+            if snapshot is not None:
+                snapshots.append(snapshot)
+    return snapshots
+
+
+def _sum_snapshots(snapshots):
+    counters = {}
+    histograms = {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot['counters']:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, buckets, total, count in snapshot['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            histogram = histograms.setdefault(key, {'buckets': [0] * len(buckets), 'sum': 0, 'count': 0})
+            histogram['buckets'] = [first + second for first, second in zip(histogram['buckets'], buckets)]
+            histogram['sum'] += total
+            histogram['count'] += count
+    return counters, histograms
+
+
+def collect():
+    """Sum metrics of all processes."""
+    return _sum_snapshots(_load_snapshots())
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped_labels = [
+        '{}="{}"'.format(name, str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n'))
+        for name, value in labels
+    ]
+    return '{' + ','.join(escaped_labels) + '}'
+
+
+def render():
+    """Render metrics of all processes in the Prometheus text format."""
+    counters, histograms = collect()
+    lines = []
+    for name, (metric_type, help_text) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        for (counter_name, labels), value in sorted(counters.items()):
+            if counter_name == name:
+                lines.append(f'{name}{_format_labels(labels)} {value}')
+        for (histogram_name, labels), histogram in sorted(histograms.items()):
+            if histogram_name != name:
+                continue
+            cumulative_count = 0
+            for upper_bound, bucket_count in zip([*LATENCY_BUCKETS, '+Inf'], histogram['buckets']):
+                cumulative_count += bucket_count
+                lines.append(f'{name}_bucket{_format_labels([*labels, ("le", upper_bound)])} {cumulative_count}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {histogram["sum"]}')
+            lines.append(f'{name}_count{_format_labels(labels)} {histogram["count"]}')
+    return '\n'.join(lines) + '\n'
+
+
+atexit.register(lambda: settings.METRICS_DIR and flush())
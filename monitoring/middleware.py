@@ -0,0 +1,56 @@
+import time
+from contextlib import ExitStack
+
+from django.db import connections
+
+from . import metrics
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started_at = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started_at
+            self.count += 1
+
+
+def get_view_name(request):
+    """Name of the URL pattern, or the pattern itself for URLs without a name."""
+    resolver_match = getattr(request, 'resolver_match', None)
+    if not resolver_match:
+        return 'unresolved'
+    return resolver_match.view_name if resolver_match.url_name else resolver_match.route
+
+
+class MetricsMiddleware:
+    """Record latency and SQL queries of every request per view name."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        query_stats = QueryStats()
+        started_at = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(query_stats))
+            response = self.get_response(request)
+        duration = time.perf_counter() - started_at
+
+        view_labels = {'view': get_view_name(request)}
+        metrics.increment('starburger_http_requests_total', {
+            **view_labels,
+            'method': request.method,
+            'status': f'{response.status_code // 100}xx',
+        })
+        metrics.observe('starburger_http_request_duration_seconds', view_labels, duration)
+        metrics.increment('starburger_db_queries_total', view_labels, query_stats.count)
+        metrics.increment('starburger_db_query_duration_seconds_total', view_labels, query_stats.duration)
+        metrics.flush_if_due()
+        return response
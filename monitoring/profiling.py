@@ -0,0 +1,159 @@
+"""Profiling of single requests on demand.
+
+A staff member adds ?profile=1 or the X-Profile header to a request. The request
+is run under cProfile and tracemalloc, the .prof file and a JSON summary are
+stored in PROFILES_DIR. Only the PROFILES_MAX_COUNT newest profiles are kept.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import threading
+import time
+import tracemalloc
+import uuid
+
+from django.conf import settings
+from django.utils import timezone
+
+
+TOP_ALLOCATIONS_COUNT = 25
+TOP_FUNCTIONS_COUNT = 40
+TRACEMALLOC_FRAMES = 5
+
+PROFILE_ID_PATTERN = re.compile(r'^[0-9]{20}-[0-9a-f]{8}$')
+
+_profiling_lock = threading.Lock()
+
+
+def is_profiling_requested(request):
+    if request.GET.get('profile') != '1' and not request.META.get('HTTP_X_PROFILE'):
+        return False
+    return request.user.is_active and request.user.is_staff
+
+
+def get_profile_path(profile_id, extension):
+    if not PROFILE_ID_PATTERN.match(profile_id):
+        raise ValueError(f'Wrong profile id {profile_id!r}')
+    return os.path.join(settings.PROFILES_DIR, f'{profile_id}.{extension}')
+
+
+def get_top_allocations(snapshot):
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, cProfile.__file__),
+    ])
+    return [
+        {
+            'location': f'{statistic.traceback[0].filename}:{statistic.traceback[0].lineno}',
+            'size': statistic.size,
+            'count': statistic.count,
+        }
+        for statistic in snapshot.statistics('lineno')[:TOP_ALLOCATIONS_COUNT]
+    ]
+
+
+def get_top_functions(profiler):
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(TOP_FUNCTIONS_COUNT)
+    return stream.getvalue()
+
+
+def save_profile(request, response, profiler, snapshot, peak_memory, duration):
+    profile_id = f'{timezone.now():%Y%m%d%H%M%S%f}-{uuid.uuid4().hex[:8]}'
+    os.makedirs(settings.PROFILES_DIR, exist_ok=True)
+
+    profiler.dump_stats(get_profile_path(profile_id, 'prof'))
+    summary = {
+        'id': profile_id,
+        'created_at': timezone.now().isoformat(),
+        'method': request.method,
+        'path': request.get_full_path(),
+        'user': request.user.get_username(),
+        'status': response.status_code,
+        'duration': duration,
+        'peak_memory': peak_memory,
+        'top_allocations': get_top_allocations(snapshot),
+        'top_functions': get_top_functions(profiler),
+    }
+    with open(get_profile_path(profile_id, 'json'), 'w') as summary_file:
+        json.dump(summary, summary_file, ensure_ascii=False)
+
+    remove_old_profiles()
+    return profile_id
+
+
+def remove_old_profiles():
+    profile_ids = sorted(
+        (filename[:-len('.json')] for filename in os.listdir(settings.PROFILES_DIR) if filename.endswith('.json')),
+        reverse=True,
+    )
+    for profile_id in profile_ids[settings.PROFILES_MAX_COUNT:]:
+        for extension in ('json', 'prof'):
+            try:
+                os.remove(get_profile_path(profile_id, extension))
+            except FileNotFoundError:
+                pass
+
+
+def get_recent_profiles():
+    if not os.path.isdir(settings.PROFILES_DIR):
+        return []
+
+    profiles = []
+    for filename in sorted(os.listdir(settings.PROFILES_DIR), reverse=True):
+        if not filename.endswith('.json'):
+            continue
+        try:
+            profiles.append(load_profile(filename[:-len('.json')]))
+        except (OSError, ValueError):
+            continue
+    return profiles
+
+
+def load_profile(profile_id):
+    with open(get_profile_path(profile_id, 'json')) as summary_file:
+        return json.load(summary_file)
+
+
+class ProfilingMiddleware:
+    """Profile requests of staff members who ask for it.
+
+    tracemalloc is global for the process, so only one request is profiled at a time,
+    others are served as usual with the X-Profile-Id header set to "busy".
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not is_profiling_requested(request):
+            return self.get_response(request)
+        if not _profiling_lock.acquire(blocking=False):
+            response = self.get_response(request)
+            response['X-Profile-Id'] = 'busy'
+            return response
+
+        try:
+            was_tracing = tracemalloc.is_tracing()
+            if not was_tracing:
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+            elif hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+            profiler = cProfile.Profile()
+            started_at = time.perf_counter()
+            try:
+                response = profiler.runcall(self.get_response, request)
+            finally:
+                duration = time.perf_counter() - started_at
+                snapshot = tracemalloc.take_snapshot()
+                _, peak_memory = tracemalloc.get_traced_memory()
+                if not was_tracing:
+                    tracemalloc.stop()
+
+            response['X-Profile-Id'] = save_profile(request, response, profiler, snapshot, peak_memory, duration)
+            return response
+        finally:
+            _profiling_lock.release()
@@ -0,0 +1,143 @@
+import json
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+
+from . import metrics
+
+
+def get_sample(text, sample):
+    for line in text.splitlines():
+        if line.startswith(sample + ' '):
+            return float(line.rsplit(' ', 1)[1])
+    return 0
+
+
+class MetricsEndpointTest(TestCase):
+    def setUp(self):
+        metrics_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, metrics_dir, ignore_errors=True)
+        settings_override = override_settings(METRICS_DIR=metrics_dir, METRICS_TOKEN=None)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.metrics_dir = metrics_dir
+
+    def test_metrics_of_other_processes_are_summed_up(self):
+        other_process_metrics = {
+            'counters': [
+                ['starburger_http_requests_total', [['method', 'GET'], ['status', '2xx'], ['view', 'other']], 3],
+            ],
+            'histograms': [
+                ['starburger_http_request_duration_seconds', [['view', 'other']], [1] + [0] * 11, 0.001, 1],
+            ],
+        }
+        with open(os.path.join(self.metrics_dir, 'otherhost-1.json'), 'w') as metrics_file:
+            json.dump(other_process_metrics, metrics_file)
+
+        self.client.get('/api/products/')
+        self.client.force_login(get_user_model().objects.create_user('manager', is_staff=True))
+        text = self.client.get('/metrics').content.decode()
+
+        self.assertEqual(get_sample(text, 'starburger_http_requests_total{method="GET",status="2xx",view="other"}'), 3)
+        self.assertEqual(get_sample(text, 'starburger_http_request_duration_seconds_bucket{view="other",le="+Inf"}'), 1)
+        self.assertGreaterEqual(
+            get_sample(text, 'starburger_http_requests_total{method="GET",status="2xx",view="api/products/"}'),
+            1,
+        )
+        self.assertGreaterEqual(get_sample(text, 'starburger_db_queries_total{view="api/products/"}'), 1)
+        self.assertGreaterEqual(get_sample(text, 'starburger_cache_requests_total{cache="catalog",result="miss"}'), 1)
+
+    def test_metrics_of_finished_processes_are_merged(self):
+        finished_process = subprocess.Popen(['true'])
+        finished_process.wait()
+        hostname = socket.gethostname()
+        for filename, value in [(f'{hostname}-{finished_process.pid}.json', 3), (f'{hostname}-finished.json', 2)]:
+            with open(os.path.join(self.metrics_dir, filename), 'w') as metrics_file:
+                json.dump({'counters': [['test_total', [['view', 'test']], value]], 'histograms': []}, metrics_file)
+
+        for _ in range(2):
+            counters, histograms = metrics.collect()
+            self.assertEqual(counters[('test_total', (('view', 'test'),))], 5)
+
+        self.assertCountEqual(
+            [filename for filename in os.listdir(self.metrics_dir) if filename.endswith('.json')],
+            [f'{hostname}-finished.json', f'{hostname}-{os.getpid()}.json'],
+        )
+
+    def test_values_fall_into_their_buckets(self):
+        metrics.observe('test_duration', {'view': 'test'}, 0.02)
+        metrics.observe('test_duration', {'view': 'test'}, 0.3)
+        counters, histograms = metrics.collect()
+
+        buckets = histograms[('test_duration', (('view', 'test'),))]['buckets']
+        self.assertEqual(buckets[metrics.LATENCY_BUCKETS.index(0.025)], 1)
+        self.assertEqual(buckets[metrics.LATENCY_BUCKETS.index(0.5)], 1)
+
+    def test_only_staff_is_allowed_without_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.client.force_login(get_user_model().objects.create_user('customer'))
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+        self.client.force_login(get_user_model().objects.create_user('manager', is_staff=True))
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    def test_token_is_required_when_configured(self):
+        with self.settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+            response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('# TYPE starburger_http_request_duration_seconds histogram', response.content.decode())
+
+
+class ProfilingTest(TestCase):
+    def setUp(self):
+        profiles_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, profiles_dir, ignore_errors=True)
+        settings_override = override_settings(PROFILES_DIR=profiles_dir, PROFILES_MAX_COUNT=2)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.profiles_dir = profiles_dir
+
+    def login(self, is_staff):
+        user = get_user_model().objects.create_user('user', is_staff=is_staff)
+        self.client.force_login(user)
+
+    def test_staff_request_is_profiled(self):
+        self.login(is_staff=True)
+
+        response = self.client.get('/api/products/?profile=1')
+        profile_id = response['X-Profile-Id']
+
+        self.assertEqual(
+            sorted(os.listdir(self.profiles_dir)),
+            [f'{profile_id}.json', f'{profile_id}.prof'],
+        )
+        profile_page = self.client.get(f'/admin/profiles/{profile_id}/')
+        self.assertContains(profile_page, 'product_list_api')
+        self.assertContains(self.client.get('/admin/profiles/'), '/api/products/?profile=1')
+
+    def test_only_newest_profiles_are_kept(self):
+        self.login(is_staff=True)
+
+        profile_ids = [
+            self.client.get('/api/products/', HTTP_X_PROFILE='1')['X-Profile-Id']
+            for _ in range(3)
+        ]
+
+        self.assertEqual(len(os.listdir(self.profiles_dir)), 4)
+        self.assertNotIn(f'{profile_ids[0]}.json', os.listdir(self.profiles_dir))
+
+    def test_other_users_are_not_profiled(self):
+        self.login(is_staff=False)
+
+        response = self.client.get('/api/products/?profile=1')
+
+        self.assertFalse(response.has_header('X-Profile-Id'))
+        self.assertEqual(os.listdir(self.profiles_dir), [])
+        self.assertEqual(self.client.get('/admin/profiles/').status_code, 302)
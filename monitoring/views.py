@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+from . import metrics
+
+
+def has_metrics_access(request):
+    """Scrapers send METRICS_TOKEN, without a token only staff may read the metrics."""
+    if not settings.METRICS_TOKEN:
+        return request.user.is_active and request.user.is_staff
+    authorization = request.META.get('HTTP_AUTHORIZATION', '')
+    token = authorization[len('Bearer '):] if authorization.startswith('Bearer ') else ''
+    return constant_time_compare(token, settings.METRICS_TOKEN)
+
+
+def metrics_view(request):
+    if not has_metrics_access(request):
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
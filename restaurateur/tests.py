@@ -1,3 +1,381 @@
-from django.test import TestCase
+import base64
+import io
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+from contextlib import closing
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connections
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from foodcartapp.models import Order, OrderEvent, Product, Restaurant, RestaurantMenuItem
+from foodcartapp.replicas import PIN_COOKIE_NAME, get_read_alias
+from foodcartapp.tests import ManagerLoginMixin, QueryBudgetTestCase, TempMediaMixin
+
+from .views import get_settled_order_event_id
+
+
+class ManagerPagesBudgetTest(QueryBudgetTestCase):
+    def setUp(self):
+        self.login_manager()
+
+    def test_products(self):
+        self.assertBudget(lambda _: self.client.get(reverse('restaurateur:ProductsView')), num_queries=7)
+
+    def test_cached_products(self):
+        def get_cached_products(_):
+            self.client.get(reverse('restaurateur:ProductsView'))
+            with self.assertNumQueries(2):
+                return self.client.get(reverse('restaurateur:ProductsView'))
+
+        self.assertBudget(get_cached_products, num_queries=9)
+
+    def test_restaurants(self):
+        self.assertBudget(lambda _: self.client.get(reverse('restaurateur:RestaurantView')), num_queries=3)
+
+    @mock.patch('restaurateur.views.ORDER_CHANGES_SETTLE_SECONDS', 0)
+    def test_order_changes(self):
+        self.assertBudget(lambda _: self.client.get(reverse('restaurateur:order_changes_api')), num_queries=6)
+
+    def test_orders(self):
+        # One of them is the cursor of the live order feed
+        self.assertBudget(lambda _: self.client.get(reverse('restaurateur:view_orders')), num_queries=10)
+
+
+class ProductsViewTest(TempMediaMixin, ManagerLoginMixin, TestCase):
+    def setUp(self):
+        self.login_manager()
+        call_command('generate_dataset', restaurants=3, products=20, orders=0, seed=0, stdout=io.StringIO())
+
+    def test_menu_change_updates_cached_table(self):
+        menu_item = RestaurantMenuItem.objects.filter(availability=True).select_related('product').first()
+        url = reverse('restaurateur:ProductsView') + f'?category={menu_item.product.category_id}&page=1'
+        self.client.get(url)
+
+        menu_item.availability = False
+        menu_item.save()
+        response = self.client.get(url)
+
+        product, availability = next(
+            (product, availability)
+            for product, availability in response.context['products_with_restaurant_availability']
+            if product.id == menu_item.product_id
+        )
+        restaurants = response.context['restaurants']
+        self.assertFalse(availability[[restaurant.id for restaurant in restaurants].index(menu_item.restaurant_id)])
+
+    def test_out_of_range_pages_share_the_last_page_cache(self):
+        url = reverse('restaurateur:ProductsView')
+        # All 20 products fit the first page
+        last_page = self.client.get(url, {'page': 1}).context['products_table']
+
+        for page_number in [0, 1001, 10 ** 9]:
+            with self.subTest(page=page_number), self.assertNumQueries(2):
+                response = self.client.get(url, {'page': page_number})
+            self.assertEqual(response.context['products_table'], last_page)
+
+    def test_products_are_filtered_by_category(self):
+        category_id = Product.objects.values_list('category_id', flat=True).first()
+
+        response = self.client.get(reverse('restaurateur:ProductsView'), {'category': category_id})
+
+        product_ids = [product.id for product, _ in response.context['products_with_restaurant_availability']]
+        self.assertEqual(
+            product_ids,
+            list(Product.objects.filter(category_id=category_id).order_by('id').values_list('id', flat=True)[:50]),
+        )
+
+
+def get_unknown_locations(*addresses):
+    return {address: (None, None) for address in addresses}
+
+
+@mock.patch('restaurateur.views.get_or_create_locations', get_unknown_locations)
+class OrdersPageTest(ManagerLoginMixin, TestCase):
+    def setUp(self):
+        self.login_manager()
+        self.burger_king = Restaurant.objects.create(name='Burger King', address='Москва, Тверская, 1')
+        self.star_burger = Restaurant.objects.create(name='Star Burger', address='Москва, Арбат, 1')
+
+    def create_orders(self, count, **fields):
+        return [
+            Order.objects.create(lastname=f'Клиент {number}', phonenumber='+79001234567', address='Москва', **fields)
+            for number in range(count)
+        ]
+
+    def get_orders(self, **params):
+        response = self.client.get(reverse('restaurateur:view_orders'), params)
+        self.assertEqual(response.status_code, 200)
+        return [order.id for order in response.context['orders']], response.context['next_page_query']
+
+    def test_pages_follow_cursor_through_ties(self):
+        orders = self.create_orders(5)
+        # Orders created in the same instant are ordered by id
+        Order.objects.update(created_at=orders[0].created_at)
+
+        pages = []
+        query = 'limit=2'
+        while query:
+            response = self.client.get(f"{reverse('restaurateur:view_orders')}?{query}")
+            pages.append([order.id for order in response.context['orders']])
+            query = response.context['next_page_query']
+
+        order_ids = [order.id for order in orders]
+        self.assertEqual(pages, [order_ids[:2], order_ids[2:4], order_ids[4:]])
+
+    def test_page_of_exactly_limit_orders_has_no_next_page(self):
+        orders = self.create_orders(2)
+
+        self.assertEqual(self.get_orders(limit=2), ([order.id for order in orders], None))
+
+    def test_bad_cursors_are_rejected(self):
+        order, = self.create_orders(1)
+        tampered_cursors = [
+            'не курсор',
+            base64.urlsafe_b64encode(b'2026-10-18T10:00:00').decode(),
+            base64.urlsafe_b64encode(f'{order.created_at.isoformat()}|x'.encode()).decode(),
+            base64.urlsafe_b64encode(b'\xff\xfe').decode(),
+        ]
+        for cursor in tampered_cursors:
+            with self.subTest(cursor=cursor):
+                response = self.client.get(reverse('restaurateur:view_orders'), {'cursor': cursor})
+                self.assertEqual(response.status_code, 400)
+
+        for params in [{'limit': 0}, {'status': 'LOST'}, {'restaurant': 999}]:
+            with self.subTest(**params):
+                self.assertEqual(self.client.get(reverse('restaurateur:view_orders'), params).status_code, 400)
+
+    def test_filters_are_combined(self):
+        unprocessed = Order.OrderStatus.UNPROCESSED
+        cash_orders = self.create_orders(2, payment_method=Order.PaymentMethod.CASH)
+        Order.objects.filter(pk=cash_orders[0].pk).update(status=unprocessed, selected_restaurant=self.star_burger)
+        Order.objects.filter(pk=cash_orders[1].pk).update(status=unprocessed, selected_restaurant=self.burger_king)
+        electric_order, = self.create_orders(1, payment_method=Order.PaymentMethod.ELECTRIC)
+        Order.objects.filter(pk=electric_order.pk).update(status=unprocessed, selected_restaurant=self.star_burger)
+        done_order, = self.create_orders(1, status=Order.OrderStatus.DONE)
+
+        self.assertEqual(
+            self.get_orders(status=unprocessed, payment_method='CASH', restaurant=self.star_burger.id)[0],
+            [cash_orders[0].id],
+        )
+        self.assertEqual(self.get_orders(restaurant=self.star_burger.id)[0], [cash_orders[0].id, electric_order.id])
+        self.assertEqual(self.get_orders(status='DONE')[0], [done_order.id])
+        self.assertNotIn(done_order.id, self.get_orders()[0])
+
+
+class ReplicaRoutingTest(TestCase):
+    """Manager pages read from a replica kept in a separate SQLite file."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.replica_dir = tempfile.mkdtemp()
+        replica_path = os.path.join(cls.replica_dir, 'replica.sqlite3')
+        # The replica starts as a copy of the migrated primary and is not synced afterwards
+        connections['default'].ensure_connection()
+        with closing(sqlite3.connect(replica_path)) as replica:
+            connections['default'].connection.backup(replica)
+        super().setUpClass()
+        # Registered after setUpClass, so the test case neither wraps the replica in a transaction nor blocks it
+        connections.databases['replica'] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': replica_path}
+        cls.replica_override = override_settings(REPLICA_DATABASES=['replica'])
+        cls.replica_override.enable()
+
+    @classmethod
+    def setUpTestData(cls):
+        Restaurant.objects.create(name='Ресторан на основной базе')
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.replica_override.disable()
+        connections['replica'].close()
+        del connections['replica']
+        del connections.databases['replica']
+        shutil.rmtree(cls.replica_dir, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        manager = get_user_model().objects.create_user('manager', is_staff=True, is_superuser=True)
+        self.client.force_login(manager)
+        self.replica_restaurant = Restaurant.objects.using('replica').create(name='Ресторан на реплике')
+
+    def tearDown(self):
+        self.replica_restaurant.delete(using='replica')
+
+    def test_read_only_views_use_replica(self):
+        response = self.client.get(reverse('restaurateur:RestaurantView'))
+        self.assertContains(response, 'Ресторан на реплике')
+        self.assertNotContains(response, 'Ресторан на основной базе')
+
+        response = self.client.get('/admin/foodcartapp/restaurant/')
+        self.assertContains(response, 'Ресторан на основной базе')
+        self.assertNotContains(response, 'Ресторан на реплике')
+
+    def test_locations_of_orders_page_use_primary(self):
+        read_aliases = []
+
+        def get_locations(*addresses):
+            read_aliases.append(get_read_alias())
+            return get_unknown_locations(*addresses)
+
+        with mock.patch('restaurateur.views.get_or_create_locations', get_locations):
+            response = self.client.get(reverse('restaurateur:view_orders'))
+
+        self.assertContains(response, 'Ресторан на реплике')
+        self.assertEqual(read_aliases, [None])
+
+    def test_client_is_pinned_to_primary_after_write(self):
+        response = self.client.post('/api/order/', {}, content_type='application/json')
+        self.assertEqual(response.cookies[PIN_COOKIE_NAME]['max-age'], settings.REPLICA_MAX_LAG)
+
+        response = self.client.get(reverse('restaurateur:RestaurantView'))
+        self.assertContains(response, 'Ресторан на основной базе')
+        self.assertNotContains(response, 'Ресторан на реплике')
+
+        self.client.cookies.pop(PIN_COOKIE_NAME)
+        response = self.client.get(reverse('restaurateur:RestaurantView'))
+        self.assertContains(response, 'Ресторан на реплике')
+
+
+@mock.patch('restaurateur.views.ORDER_EVENTS_SETTLE_SECONDS', 0)
+class OrderEventsStreamTest(TestCase):
+    def setUp(self):
+        manager = get_user_model().objects.create_user('manager', is_staff=True)
+        self.client.force_login(manager)
+        self.order = Order.objects.create(firstname='Иван', lastname='Иванов', phonenumber='+79001234567', address='Москва')
+
+    def read_events(self, **kwargs):
+        response = self.client.get(reverse('restaurateur:order_events'), **kwargs)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = []
+        for message in response.content.decode().split('\n\n'):
+            fields = dict(line.split(': ', 1) for line in message.splitlines() if not line.startswith(':'))
+            if 'data' in fields:
+                events.append((int(fields['id']), fields['event'], json.loads(fields['data'])))
+        return events
+
+    def test_stream_starts_from_the_page_cursor(self):
+        restaurant = Restaurant.objects.create(name='Star Burger')
+        cursor = OrderEvent.objects.latest('pk').pk
+        self.order.selected_restaurant = restaurant
+        self.order.status = Order.OrderStatus.DONE
+        self.order.save()
+
+        events = self.read_events(data={'cursor': cursor})
+
+        self.assertEqual([kind for _, kind, _ in events], ['status_changed', 'restaurant_assigned'])
+        self.assertEqual(events[1][2], {
+            'order': self.order.pk,
+            'status': 'DONE',
+            'restaurant': {'id': restaurant.pk, 'name': 'Star Burger'},
+        })
+
+    def test_reconnect_resumes_after_last_event(self):
+        created_event_id, kind, data = self.read_events(data={'cursor': 0})[0]
+        self.assertEqual((kind, data['address'], data['status']), ('created', 'Москва', self.order.status))
+
+        self.order.status = Order.OrderStatus.DONE
+        self.order.save()
+        events = self.read_events(data={'cursor': 0}, HTTP_LAST_EVENT_ID=str(created_event_id))
+
+        self.assertEqual([kind for _, kind, _ in events], ['status_changed'])
+
+    def test_event_committed_after_a_later_one_is_not_skipped(self):
+        cursor = self.order.events.get().pk
+        OrderEvent.objects.update(created_at=F('created_at') - timedelta(seconds=2))
+        later_event = OrderEvent.objects.create(pk=cursor + 10, order=self.order, kind=OrderEvent.Kind.STATUS_CHANGED)
+
+        with mock.patch('restaurateur.views.ORDER_EVENTS_SETTLE_SECONDS', 2):
+            self.assertEqual(get_settled_order_event_id(), cursor)
+            self.assertEqual(self.read_events(data={'cursor': cursor}), [])
+
+            # The transaction that took the lower id commits only now
+            earlier_event = OrderEvent.objects.create(
+                pk=cursor + 5, order=self.order, kind=OrderEvent.Kind.RESTAURANT_ASSIGNED,
+            )
+            OrderEvent.objects.filter(pk__gt=cursor).update(created_at=F('created_at') - timedelta(seconds=2))
+            events = self.read_events(data={'cursor': cursor})
+
+        self.assertEqual([event_id for event_id, _, _ in events], [earlier_event.pk, later_event.pk])
+
+    @mock.patch('restaurateur.views.ORDER_EVENTS_BATCH_SIZE', 1)
+    def test_every_response_sends_one_batch(self):
+        self.order.status = Order.OrderStatus.DONE
+        self.order.save()
+
+        first_batch = self.read_events(data={'cursor': 0})
+        second_batch = self.read_events(data={'cursor': 0}, HTTP_LAST_EVENT_ID=str(first_batch[-1][0]))
+
+        self.assertEqual([kind for _, kind, _ in first_batch + second_batch], ['created', 'status_changed'])
+
+    def test_stream_without_cursor_sends_only_new_events(self):
+        self.assertEqual(self.read_events(), [])
+        self.assertEqual(self.client.get(reverse('restaurateur:order_events'), {'cursor': 'x'}).status_code, 400)
+
+
+@mock.patch('restaurateur.views.ORDER_CHANGES_SETTLE_SECONDS', 0)
+class OrderChangesApiTest(TempMediaMixin, ManagerLoginMixin, TestCase):
+    def setUp(self):
+        self.login_manager()
+        call_command('generate_dataset', restaurants=3, products=10, orders=5, seed=0, stdout=io.StringIO())
+
+    def get_changes(self, **params):
+        response = self.client.get(reverse('restaurateur:order_changes_api'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_only_changes_after_cursor_are_returned(self):
+        changes = self.get_changes()
+        self.assertEqual(len(changes['orders']), 5)
+        self.assertFalse(changes['has_more'])
+
+        self.assertEqual(self.get_changes(since=changes['cursor']), {
+            'orders': [],
+            'cursor': changes['cursor'],
+            'has_more': False,
+        })
+
+        order = Order.objects.order_by('pk').first()
+        order.status = Order.OrderStatus.DONE
+        order.save()
+        other_order = Order.objects.order_by('pk').last()
+        Order.objects.filter(pk=other_order.pk).update_total_prices()
+
+        new_changes = self.get_changes(since=changes['cursor'])
+        self.assertEqual([dumped['id'] for dumped in new_changes['orders']], [order.pk, other_order.pk])
+        self.assertEqual(new_changes['orders'][0]['status'], 'DONE')
+
+    def test_pages(self):
+        first_page = self.get_changes(limit=3)
+        second_page = self.get_changes(limit=3, since=first_page['cursor'])
+
+        self.assertTrue(first_page['has_more'])
+        self.assertFalse(second_page['has_more'])
+        order_ids = [dumped['id'] for dumped in first_page['orders'] + second_page['orders']]
+        self.assertEqual(sorted(order_ids), list(Order.objects.order_by('pk').values_list('pk', flat=True)))
+
+    def test_candidate_restaurants_have_every_product(self):
+        for dumped in self.get_changes()['orders']:
+            order = Order.objects.get(pk=dumped['id'])
+            expected = {restaurant.pk for restaurant in Restaurant.objects.all() if all(
+                restaurant.menu_items.filter(product=item.product, availability=True).exists()
+                for item in order.ordered_items.all()
+            )}
+            self.assertEqual(set(dumped['candidate_restaurants']), expected)
+            self.assertEqual(dumped['total_price'], str(order.total_price))
+
+    def test_bad_requests(self):
+        url = reverse('restaurateur:order_changes_api')
+        self.assertEqual(self.client.get(url, {'since': 'broken'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'limit': 0}).status_code, 400)
+
+        self.client.logout()
+        self.assertEqual(self.client.get(url).status_code, 403)
@@ -1,15 +1,36 @@
+import base64
+import binascii
+import itertools
+import json
+from datetime import datetime, timedelta
+
+import numpy as np
+
 from django import forms
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
 from django.shortcuts import redirect, render
 from django.views import View
 from django.urls import reverse_lazy
 from django.contrib.auth.decorators import user_passes_test
 from django.contrib.auth import authenticate, login
 from django.contrib.auth import views as auth_views
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, HttpResponseBadRequest
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.safestring import mark_safe
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
 
-from geopy.distance import distance
-
+from location.distances import get_distance_matrix, refine_nearest_distances
 from location.views import get_or_create_locations
-from foodcartapp.models import Product, Restaurant, Order
+from foodcartapp.models import Order, OrderEvent, Product, ProductCategory, Restaurant, RestaurantMenuItem
+from foodcartapp.replicas import get_cache_timeout, read_only_view, use_primary
+from foodcartapp.versions import get_version
 
 
 class Login(forms.Form):
@@ -29,6 +50,91 @@ class Login(forms.Form):
     )
 
 
+PRODUCTS_PAGE_SIZE = 50
+PRODUCTS_TABLE_CACHE_TIMEOUT = 24 * 60 * 60
+
+ORDERS_PAGE_SIZE = 50
+ORDERS_MAX_PAGE_SIZE = 200
+
+ORDER_CHANGES_PAGE_SIZE = 100
+ORDER_CHANGES_MAX_PAGE_SIZE = 500
+# updated_at is taken before commit, so a slow transaction may commit an order older than
+# ones already sent. The freshest changes wait a bit, so such orders are not skipped.
+ORDER_CHANGES_SETTLE_SECONDS = 2
+
+ORDER_EVENTS_BATCH_SIZE = 100
+# Event ids are taken on insert but become visible on commit, so a lower id may show up after a
+# higher one was sent. Events are sent only after they settle and stop at the first fresh one.
+ORDER_EVENTS_SETTLE_SECONDS = 2
+# Every response ends right after the new events, so a page does not hold a worker between
+# them. The browser comes back after the delay with the id of the last event it got.
+ORDER_EVENTS_RECONNECT_DELAY_MS = 2000
+
+
+def encode_order_cursor(order, field='created_at'):
+    cursor = f'{getattr(order, field).isoformat()}|{order.id}'
+    return base64.urlsafe_b64encode(cursor.encode()).decode()
+
+
+def decode_order_cursor(cursor):
+    try:
+        created_at, order_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(created_at), int(order_id)
+    except (binascii.Error, UnicodeError, ValueError):
+        raise forms.ValidationError('Неверный курсор')
+
+
+class OrderChangesFilter(forms.Form):
+    since = forms.CharField(required=False)
+    limit = forms.IntegerField(required=False, min_value=1, max_value=ORDER_CHANGES_MAX_PAGE_SIZE)
+
+    def clean_since(self):
+        since = self.cleaned_data['since']
+        if since:
+            return decode_order_cursor(since)
+        return None
+
+
+class ProductsFilter(forms.Form):
+    category = forms.ModelChoiceField(
+        label='Категория', required=False,
+        queryset=ProductCategory.objects.order_by('name'),
+        empty_label='Все',
+        widget=forms.Select(attrs={'class': 'form-control'}),
+    )
+
+
+class OrdersFilter(forms.Form):
+    status = forms.ChoiceField(
+        label='Статус', required=False,
+        choices=[('', 'Все необработанные'), *Order.OrderStatus.choices],
+        widget=forms.Select(attrs={'class': 'form-control'}),
+    )
+    payment_method = forms.ChoiceField(
+        label='Способ оплаты', required=False,
+        choices=[('', 'Любой'), *Order.PaymentMethod.choices],
+        widget=forms.Select(attrs={'class': 'form-control'}),
+    )
+    restaurant = forms.ModelChoiceField(
+        label='Ресторан', required=False,
+        queryset=Restaurant.objects.order_by('name'),
+        empty_label='Любой',
+        widget=forms.Select(attrs={'class': 'form-control'}),
+    )
+    limit = forms.IntegerField(
+        label='На странице', required=False,
+        min_value=1,
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'placeholder': ORDERS_PAGE_SIZE}),
+    )
+    cursor = forms.CharField(required=False, widget=forms.HiddenInput)
+
+    def clean_cursor(self):
+        cursor = self.cleaned_data['cursor']
+        if cursor:
+            return decode_order_cursor(cursor)
+        return None
+
+
 class LoginView(View):
     def get(self, request, *args, **kwargs):
         form = Login()
@@ -64,27 +170,77 @@ def is_manager(user):
     return user.is_staff  # FIXME replace with specific permission
 
 
+def get_availability_matrix(products, restaurants):
+    """Boolean products × restaurants matrix of menu items in stock, built with one query."""
+    product_rows = {product.id: row for row, product in enumerate(products)}
+    restaurant_columns = {restaurant.id: column for column, restaurant in enumerate(restaurants)}
+    matrix = np.zeros((len(products), len(restaurants)), dtype=bool)
+
+    menu_items = RestaurantMenuItem.objects.filter(
+        product_id__in=product_rows,
+        availability=True,
+    ).values_list('product_id', 'restaurant_id')
+    for product_id, restaurant_id in menu_items:
+        if restaurant_id in restaurant_columns:
+            matrix[product_rows[product_id], restaurant_columns[restaurant_id]] = True
+    return matrix
+
+
+def render_products_table(category_id, page_number):
+    products_filter = ProductsFilter({'category': category_id})
+    products = Product.objects.select_related('category').order_by('id')
+    if products_filter.is_valid() and products_filter.cleaned_data['category']:
+        products = products.filter(category=products_filter.cleaned_data['category'])
+
+    page = Paginator(products, PRODUCTS_PAGE_SIZE).get_page(page_number)
+    products = list(page)
+    restaurants = list(Restaurant.objects.order_by('name'))
+    matrix = get_availability_matrix(products, restaurants)
+
+    products_table = render_to_string('products_table.html', {
+        'products_filter': products_filter,
+        'products_with_restaurant_availability': list(zip(products, matrix.tolist())),
+        'restaurants': restaurants,
+        'page': page,
+    })
+    return products_table, page
+
+
 @user_passes_test(is_manager, login_url='restaurateur:login')
+@read_only_view
 def view_products(request):
-    restaurants = list(Restaurant.objects.order_by('name'))
-    products = list(Product.objects.prefetch_related('menu_items'))
+    try:
+        category_id = int(request.GET['category']) if request.GET.get('category') else None
+        page_number = int(request.GET.get('page', 1))
+    except ValueError:
+        return HttpResponseBadRequest('Неверный номер категории или страницы')
 
-    products_with_restaurant_availability = []
-    for product in products:
-        availability = {item.restaurant_id: item.availability for item in product.menu_items.all()}
-        ordered_availability = [availability.get(restaurant.id, False) for restaurant in restaurants]
+    cache_key_prefix = 'restaurateur:products_table:{}:{}:{}'.format(
+        get_version('menu'),
+        get_version('catalog'),
+        category_id,
+    )
+    # Out of range pages show the last page, so they share its cache entry
+    pages_count = cache.get(f'{cache_key_prefix}:pages')
+    if pages_count is not None and not 1 <= page_number <= pages_count:
+        page_number = pages_count
 
-        products_with_restaurant_availability.append(
-            (product, ordered_availability)
-        )
+    products_table = cache.get(f'{cache_key_prefix}:{page_number}')
+    if products_table is None:
+        products_table, page = render_products_table(category_id, page_number)
+        cache_timeout = get_cache_timeout(PRODUCTS_TABLE_CACHE_TIMEOUT)
+        cache.set_many({
+            f'{cache_key_prefix}:{page.number}': products_table,
+            f'{cache_key_prefix}:pages': page.paginator.num_pages,
+        }, cache_timeout)
 
     return render(request, template_name="products_list.html", context={
-        'products_with_restaurant_availability': products_with_restaurant_availability,
-        'restaurants': restaurants,
+        'products_table': mark_safe(products_table),
     })
 
 
 @user_passes_test(is_manager, login_url='restaurateur:login')
+@read_only_view
 def view_restaurants(request):
     return render(request, template_name="restaurants_list.html", context={
         'restaurants': Restaurant.objects.all(),
@@ -92,31 +248,167 @@ def view_restaurants(request):
 
 
 @user_passes_test(is_manager, login_url='restaurateur:login')
+@read_only_view
 def view_orders(request):
-    orders = Order.objects\
-                        .filter(status__in=[Order.OrderStatus.UNPROCESSED, Order.OrderStatus.IN_PROGRESS])\
-                        .get_order_prices()\
-                        .select_related('selected_restaurant')\
-                        .prefetch_related('ordered_items')\
-                        .get_accessible_restaurants()
+    orders_filter = OrdersFilter(request.GET)
+    if not orders_filter.is_valid():
+        return HttpResponseBadRequest(orders_filter.errors.as_text())
+    filters = orders_filter.cleaned_data
 
+    # Taken before the orders, so the live feed of the page misses no change made after them.
+    # Fresh events are sent again, the page ignores orders it already shows.
+    events_cursor = get_settled_order_event_id()
+    orders = Order.objects.order_by('created_at', 'id')
+    if filters['status']:
+        orders = orders.filter(status=filters['status'])
+    else:
+        orders = orders.filter(status__in=[Order.OrderStatus.UNPROCESSED, Order.OrderStatus.IN_PROGRESS])
+    if filters['payment_method']:
+        orders = orders.filter(payment_method=filters['payment_method'])
+    if filters['restaurant']:
+        orders = orders.filter(selected_restaurant=filters['restaurant'])
+    if filters['cursor']:
+        orders = orders.after(*filters['cursor'])
+
+    limit = min(filters['limit'] or ORDERS_PAGE_SIZE, ORDERS_MAX_PAGE_SIZE)
+    orders = list(
+        orders
+        .select_related('selected_restaurant')
+        .prefetch_related('ordered_items')[:limit + 1]
+        .get_accessible_restaurants()
+    )
+    next_cursor = encode_order_cursor(orders[limit - 1]) if len(orders) > limit else None
+    orders = orders[:limit]
+
+    restaurants = list(Restaurant.objects.all())
     order_addresses = [order.address for order in orders]
-    restaurant_addresses = [restaurant.address for restaurant in Restaurant.objects.all()]
-
-    locations = get_or_create_locations(*order_addresses, *restaurant_addresses)
-    for order in orders:
-        if order.selected_restaurant:
-            order.status = Order.OrderStatus.IN_PROGRESS
-            order.save()
-        order_location = locations[order.address]
+    restaurant_addresses = [restaurant.address for restaurant in restaurants]
+
+    # Geocoded addresses are saved, and a lagging replica would make them geocoded again
+    with use_primary():
+        locations = get_or_create_locations(*order_addresses, *restaurant_addresses)
+    order_coordinates = [locations[address] for address in order_addresses]
+    restaurant_coordinates = [locations[address] for address in restaurant_addresses]
+
+    restaurant_columns = {restaurant.id: column for column, restaurant in enumerate(restaurants)}
+    accessible = np.zeros((len(orders), len(restaurants)), dtype=bool)
+    for row, order in enumerate(orders):
         for restaurant in order.are_available_restaurants:
-            restaurant_location = locations[restaurant.address]
-            lat, lng = order_location
-            if lat or lng:
-                restaurant.distance = distance(order_location, restaurant_location).km
-            else:
-                restaurant.distance = 0
-        sorted_restaurants = sorted(order.are_available_restaurants, key=lambda restaurant: restaurant.distance)
-        order.sorted_restaurants = sorted_restaurants
-        order.save()
-    return render(request, template_name='order_items.html', context={'orders': orders})
+            accessible[row, restaurant_columns[restaurant.id]] = True
+
+    distances = get_distance_matrix(order_coordinates, restaurant_coordinates)
+    refine_nearest_distances(
+        distances,
+        order_coordinates,
+        restaurant_coordinates,
+        settings.GEODESIC_REFINEMENT_TOP_K,
+        mask=accessible,
+    )
+    distances = np.nan_to_num(distances, nan=0)
+
+    for row, order in enumerate(orders):
+        columns = np.flatnonzero(accessible[row])
+        sorted_columns = columns[np.argsort(distances[row, columns], kind='stable')]
+        order.sorted_restaurants = [
+            (restaurants[column], float(distances[row, column])) for column in sorted_columns
+        ]
+
+    next_page_query = None
+    if next_cursor:
+        next_page_query = request.GET.copy()
+        next_page_query['cursor'] = next_cursor
+        next_page_query = next_page_query.urlencode()
+
+    return render(request, template_name='order_items.html', context={
+        'orders': orders,
+        'orders_filter': orders_filter,
+        'next_page_query': next_page_query,
+        'events_cursor': events_cursor,
+        # New orders go to the end of the unfiltered list, so only its last page can show them
+        'append_new_orders': not next_cursor and not any(
+            filters[field] for field in ('status', 'payment_method', 'restaurant')
+        ),
+    })
+
+
+def dump_order_change(order):
+    return {
+        'id': order.id,
+        'status': order.status,
+        'payment_method': order.payment_method,
+        'total_price': str(order.total_price),
+        'firstname': order.firstname,
+        'lastname': order.lastname,
+        'phonenumber': str(order.phonenumber),
+        'address': order.address,
+        'restaurant': order.selected_restaurant_id,
+        'candidate_restaurants': sorted(restaurant.id for restaurant in order.are_available_restaurants),
+        'created_at': order.created_at,
+        'updated_at': order.updated_at,
+    }
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def order_changes_api(request):
+    """Orders created or changed after the cursor, oldest change first.
+
+    Pass the returned cursor as since in the next request. Reads stay on the primary,
+    as a lagging replica would let the cursor move past orders it has not received yet.
+    """
+    changes_filter = OrderChangesFilter(request.GET)
+    if not changes_filter.is_valid():
+        return Response(changes_filter.errors, status=status.HTTP_400_BAD_REQUEST)
+    since = changes_filter.cleaned_data['since']
+    limit = changes_filter.cleaned_data['limit'] or ORDER_CHANGES_PAGE_SIZE
+
+    settled_before = timezone.now() - timedelta(seconds=ORDER_CHANGES_SETTLE_SECONDS)
+    orders = Order.objects.filter(updated_at__lt=settled_before).order_by('updated_at', 'id')
+    if since:
+        orders = orders.changed_after(*since)
+    orders = list(orders.prefetch_related('ordered_items')[:limit + 1].get_accessible_restaurants())
+    has_more = len(orders) > limit
+    orders = orders[:limit]
+
+    return Response({
+        'orders': [dump_order_change(order) for order in orders],
+        'cursor': encode_order_cursor(orders[-1], 'updated_at') if orders else request.GET.get('since') or None,
+        'has_more': has_more,
+    })
+
+
+def get_settled_before():
+    return timezone.now() - timedelta(seconds=ORDER_EVENTS_SETTLE_SECONDS)
+
+
+def get_settled_order_event_id():
+    """Id of the latest event that settled, no event with a lower id is committed after it."""
+    settled_events = OrderEvent.objects.filter(created_at__lt=get_settled_before()).order_by('-pk')
+    return settled_events.values_list('pk', flat=True).first() or 0
+
+
+def format_order_event(event):
+    data = json.dumps({'order': event.order_id, **event.payload}, ensure_ascii=False, cls=DjangoJSONEncoder)
+    return f'id: {event.pk}\nevent: {event.kind}\ndata: {data}\n\n'
+
+
+def get_order_events_message(cursor):
+    """Settled events after the cursor, checking only the tail of the events table."""
+    events = list(OrderEvent.objects.filter(pk__gt=cursor).order_by('pk')[:ORDER_EVENTS_BATCH_SIZE])
+    settled_before = get_settled_before()
+    settled_events = itertools.takewhile(lambda event: event.created_at < settled_before, events)
+    return f'retry: {ORDER_EVENTS_RECONNECT_DELAY_MS}\n\n' + ''.join(map(format_order_event, settled_events))
+
+
+@user_passes_test(is_manager, login_url='restaurateur:login')
+def view_order_events(request):
+    # Browsers send Last-Event-ID when they reconnect, the first request carries the cursor of the page
+    cursor = request.headers.get('Last-Event-ID') or request.GET.get('cursor')
+    try:
+        cursor = int(cursor) if cursor else get_settled_order_event_id()
+    except ValueError:
+        return HttpResponseBadRequest('Неверный номер события')
+
+    response = HttpResponse(get_order_events_message(cursor), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    return response
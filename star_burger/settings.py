@@ -14,6 +14,28 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 SECRET_KEY = env('SECRET_KEY')
 DEBUG = env.bool('DEBUG', True)
 YANDEX_API_KEY = env('YANDEX_API_KEY')
+GEOCODER_URL = env('GEOCODER_URL', 'https://geocode-maps.yandex.ru/1.x')
+GEOCODER_MAX_WORKERS = env.int('GEOCODER_MAX_WORKERS', 8)
+GEOCODER_TIMEOUT = env.float('GEOCODER_TIMEOUT', 5)
+GEOCODER_RETRIES = env.int('GEOCODER_RETRIES', 2)
+GEOCODER_RETRY_BACKOFF = env.float('GEOCODER_RETRY_BACKOFF', 0.5)
+GEOCODE_TTL = env.int('GEOCODE_TTL', 30 * 24 * 60 * 60)
+GEOCODE_NEGATIVE_TTL = env.int('GEOCODE_NEGATIVE_TTL', 24 * 60 * 60)
+GEOCODE_BACKGROUND_REFRESH = env.bool('GEOCODE_BACKGROUND_REFRESH', True)
+GEOCODE_FUZZY_MATCH_THRESHOLD = env.float('GEOCODE_FUZZY_MATCH_THRESHOLD', None)
+GEODESIC_REFINEMENT_TOP_K = env.int('GEODESIC_REFINEMENT_TOP_K', 0)
+ORDER_IDEMPOTENCY_KEY_TTL = env.int('ORDER_IDEMPOTENCY_KEY_TTL', 24 * 60 * 60)
+ORDER_EVENT_TTL = env.int('ORDER_EVENT_TTL', 7 * 24 * 60 * 60)
+ORDER_INTAKE_MODE = env.str('ORDER_INTAKE_MODE', 'sync', validate=lambda mode: mode in ('sync', 'buffered'))
+ORDER_INTAKE_DIR = env.str('ORDER_INTAKE_DIR', os.path.join(BASE_DIR, 'order_intake'))
+ORDER_INTAKE_SEGMENT_SECONDS = env.int('ORDER_INTAKE_SEGMENT_SECONDS', 5)
+ORDER_INTAKE_FSYNC = env.bool('ORDER_INTAKE_FSYNC', True)
+METRICS_DIR = env.str('METRICS_DIR', os.path.join(BASE_DIR, 'metrics'))
+METRICS_FLUSH_INTERVAL = env.float('METRICS_FLUSH_INTERVAL', 5)
+METRICS_TOKEN = env.str('METRICS_TOKEN', None)
+PROFILES_DIR = env.str('PROFILES_DIR', os.path.join(BASE_DIR, 'profiles'))
+PROFILES_MAX_COUNT = env.int('PROFILES_MAX_COUNT', 50)
+REPLICA_MAX_LAG = env.int('REPLICA_MAX_LAG', 10)
 
 ALLOWED_HOSTS = env.list('ALLOWED_HOSTS')
 
@@ -26,23 +48,30 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    'debug_toolbar',
     'phonenumber_field',
     'rest_framework',
     'location',
+    'monitoring',
 ]
 
 MIDDLEWARE = [
+    'monitoring.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'star_burger.staticfiles.StaticFilesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'foodcartapp.replicas.PrimaryPinMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
+    'monitoring.profiling.ProfilingMiddleware',
 ]
 
+if DEBUG:
+    INSTALLED_APPS.append('debug_toolbar')
+    MIDDLEWARE.append('debug_toolbar.middleware.DebugToolbarMiddleware')
+
 ROOT_URLCONF = 'star_burger.urls'
 
 DEBUG_TOOLBAR_PANELS = [
@@ -83,12 +112,27 @@ WSGI_APPLICATION = 'star_burger.wsgi.application'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
 
+TEST_RUNNER = 'star_burger.test_runner.TempDirsDiscoverRunner'
+
 DATABASES = {
     'default': dj_database_url.config(
         default='sqlite:////{0}'.format(os.path.join(BASE_DIR, 'db.sqlite3'))
     )
 }
 
+REPLICA_DATABASES = []
+for number, replica_url in enumerate(env.list('REPLICA_DATABASE_URLS', []), start=1):
+    alias = f'replica{number}'
+    # Tests run against the primary only
+    DATABASES[alias] = {**dj_database_url.parse(replica_url), 'TEST': {'MIRROR': 'default'}}
+    REPLICA_DATABASES.append(alias)
+
+DATABASE_ROUTERS = ['foodcartapp.replicas.ReplicaRouter']
+
+CACHES = {
+    'default': env.dj_cache_url('CACHE_URL', default='locmem://'),
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -125,6 +169,8 @@ STATICFILES_DIRS = [
     os.path.join(BASE_DIR, "bundles"),
 ]
 
+STATICFILES_STORAGE = 'star_burger.staticfiles.CompressedManifestStaticFilesStorage'
+
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny'
@@ -0,0 +1,196 @@
+"""Static files with content-hashed names, precompressed copies and long-term caching.
+
+collectstatic writes file.<hash>.js together with file.<hash>.js.gz and, when the
+brotli package is installed, file.<hash>.js.br. StaticFilesMiddleware serves
+STATIC_ROOT itself: it picks the best precompressed copy the client accepts,
+marks hashed files as immutable and answers range requests.
+"""
+import gzip
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date, parse_etags
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.map', '.svg', '.json', '.txt', '.html', '.xml', '.ico', '.ttf', '.eot'}
+MIN_COMPRESSIBLE_SIZE = 256
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+MUTABLE_CACHE_CONTROL = 'public, max-age=60, must-revalidate'
+
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+HASHED_NAME_PATTERN = re.compile(r'^(?P<root>.+)\.[0-9a-f]{12}(?P<extension>\.[^./]+)?$')
+
+
+def get_encoders():
+    encoders = [('gzip', '.gz', lambda content: gzip.compress(content, compresslevel=9, mtime=0))]
+    if brotli:
+        encoders.insert(0, ('br', '.br', lambda content: brotli.compress(content, quality=11)))
+    return encoders
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    manifest_strict = False
+
+    def post_process(self, paths, dry_run=False, **options):
+        processed_names = set()
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if not isinstance(processed, Exception):
+                processed_names.add(name)
+            yield name, hashed_name, processed
+
+        if dry_run:
+            return
+        # CSS is hashed in several passes, only the final names from the manifest are served
+        for name in processed_names:
+            self.compress(name)
+            hashed_name = self.hashed_files.get(self.hash_key(self.clean_name(name)))
+            if hashed_name:
+                self.compress(hashed_name)
+
+    def compress(self, name):
+        if os.path.splitext(name)[1].lower() not in COMPRESSIBLE_EXTENSIONS:
+            return
+        path = self.path(name)
+        with open(path, 'rb') as original_file:
+            content = original_file.read()
+        if len(content) < MIN_COMPRESSIBLE_SIZE:
+            return
+
+        for _, suffix, encode in get_encoders():
+            compressed = encode(content)
+            if len(compressed) < len(content):
+                with open(path + suffix, 'wb') as compressed_file:
+                    compressed_file.write(compressed)
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            # The file is not collected yet, as in tests and local development
+            return name
+
+
+def get_accepted_encodings(request):
+    accepted_encodings = set()
+    for encoding in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        encoding, _, params = encoding.strip().partition(';')
+        quality = params.strip()
+        if quality.startswith('q=') and quality[2:].strip() in {'0', '0.0', '0.00', '0.000'}:
+            continue
+        accepted_encodings.add(encoding.strip().lower())
+    return accepted_encodings
+
+
+def get_byte_range(range_header, size):
+    """(start, end) of a single byte range, None for a header to ignore, False for unsatisfiable ranges."""
+    match = RANGE_PATTERN.match(range_header.strip())
+    if not match:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        suffix_length = int(end)
+        if not suffix_length:
+            return False
+        return max(0, size - suffix_length), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def is_immutable(name):
+    """Whether the name is a content-hashed name from the manifest, so its content never changes."""
+    match = HASHED_NAME_PATTERN.match(name)
+    if not match:
+        return False
+    original_name = match['root'] + (match['extension'] or '')
+    return getattr(staticfiles_storage, 'hashed_files', {}).get(original_name) == name
+
+
+class StaticFilesMiddleware:
+    """Serve collected static files with precompression, caching and range support."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.method not in ('GET', 'HEAD') or not request.path.startswith(settings.STATIC_URL):
+            return self.get_response(request)
+
+        name = request.path[len(settings.STATIC_URL):]
+        try:
+            path = safe_join(settings.STATIC_ROOT, name)
+        except ValueError:
+            return self.get_response(request)
+        if not settings.STATIC_ROOT or not os.path.isfile(path):
+            return self.get_response(request)
+        return self.serve(request, name, path)
+
+    def serve(self, request, name, path):
+        content_type, _ = mimetypes.guess_type(name)
+        content_encoding = None
+        accepted_encodings = get_accepted_encodings(request)
+        for encoding, suffix, _ in get_encoders():
+            if encoding in accepted_encodings and os.path.isfile(path + suffix):
+                content_encoding = encoding
+                path += suffix
+                break
+
+        stat = os.stat(path)
+        etag = f'"{int(stat.st_mtime):x}-{stat.st_size:x}{"-" + content_encoding if content_encoding else ""}"'
+        headers = {
+            'ETag': etag,
+            'Last-Modified': http_date(stat.st_mtime),
+            'Cache-Control': IMMUTABLE_CACHE_CONTROL if is_immutable(name) else MUTABLE_CACHE_CONTROL,
+        }
+
+        if_none_match = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+        if etag in if_none_match or '*' in if_none_match:
+            response = HttpResponseNotModified()
+        else:
+            response = self.get_content_response(request, path, stat.st_size, etag)
+            response['Content-Type'] = content_type or 'application/octet-stream'
+            if content_encoding:
+                response['Content-Encoding'] = content_encoding
+
+        for header, value in headers.items():
+            response[header] = value
+        patch_vary_headers(response, ['Accept-Encoding'])
+        return response
+
+    def get_content_response(self, request, path, size, etag):
+        byte_range = None
+        range_header = request.META.get('HTTP_RANGE')
+        if_range = request.META.get('HTTP_IF_RANGE')
+        if range_header and (not if_range or if_range == etag):
+            byte_range = get_byte_range(range_header, size)
+
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+        elif byte_range:
+            start, end = byte_range
+            with open(path, 'rb') as static_file:
+                static_file.seek(start)
+                response = HttpResponse(static_file.read(end - start + 1), status=206)
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        else:
+            response = FileResponse(open(path, 'rb'))
+            del response['Content-Disposition']
+        response['Accept-Ranges'] = 'bytes'
+        return response
@@ -0,0 +1,30 @@
+"""Test runner that keeps the test run away from the directories of the site.
+
+Every request made by the test client passes through MetricsMiddleware, and
+the migrations copy banner images into default_storage when they create the
+test database. The runner points METRICS_DIR and MEDIA_ROOT at temporary
+directories for the whole run, before the databases are set up.
+"""
+import shutil
+import tempfile
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TempDirsDiscoverRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.metrics_dir = tempfile.mkdtemp()
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(METRICS_DIR=self.metrics_dir, MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.settings_override.disable()
+        shutil.rmtree(self.metrics_dir, ignore_errors=True)
+        shutil.rmtree(self.media_root, ignore_errors=True)
+        # The process still flushes its metrics at exit, which would write them
+        # into the real directory, so file metrics stay off until then.
+        override_settings(METRICS_DIR='').enable()
+        super().teardown_test_environment(**kwargs)
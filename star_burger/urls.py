@@ -19,14 +19,29 @@ from django.contrib import admin
 from django.urls import path, include
 from django.shortcuts import render
 
+from monitoring import admin_views
+from monitoring.views import metrics_view
+
 from . import settings
 
 urlpatterns = [
+    path('admin/profiles/', admin.site.admin_view(admin_views.profile_list), name='admin-profiles'),
+    path(
+        'admin/profiles/<str:profile_id>/',
+        admin.site.admin_view(admin_views.profile_detail),
+        name='admin-profile-detail',
+    ),
+    path(
+        'admin/profiles/<str:profile_id>/download/',
+        admin.site.admin_view(admin_views.profile_download),
+        name='admin-profile-download',
+    ),
     path('admin/', admin.site.urls),
     path('', render, kwargs={'template_name': 'index.html'}, name='start_page'),
     path('api/', include('foodcartapp.urls')),
     path('manager/', include('restaurateur.urls')),
     path('api-auth/', include('rest_framework.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 
 if settings.DEBUG: